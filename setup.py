@@ -26,6 +26,9 @@ setup(name="pipelinewise-singer-python",
           'ciso8601',
       ],
       extras_require={
+          'zstd': [
+              'zstandard'
+          ],
           'dev': [
               'pylint==2.11.1',
               'pytest==7.1.2',
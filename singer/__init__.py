@@ -10,10 +10,11 @@ from singer.utils import (
     should_sync_field,
 )
 
-from singer.logger import get_logger
+from singer.logger import LogSampler, get_logger
 
 from singer.metrics import (
     Counter,
+    MetricsRegistry,
     Timer,
     http_request_timer,
     job_timer,
@@ -21,14 +22,24 @@ from singer.metrics import (
 )
 
 from singer.messages import (
+    DECIMAL_AS_FLOAT,
+    DECIMAL_EXACT,
     ActivateVersionMessage,
+    AsyncMessageWriter,
+    BackgroundMessageWriter,
+    LazyRecordMessage,
     Message,
+    MessageReader,
+    MessageWriter,
     RecordMessage,
     SchemaMessage,
     StateMessage,
     BatchMessage,
     format_message,
+    get_message_writer,
     parse_message,
+    set_decimal_mode,
+    set_message_writer,
     write_message,
     write_record,
     write_records,
@@ -38,11 +49,22 @@ from singer.messages import (
     write_batch
 )
 
+from singer.batch import (
+    BatchReader,
+    BatchWriter,
+)
+
 from singer.transform import (
     NO_INTEGER_DATETIME_PARSING,
     UNIX_SECONDS_INTEGER_DATETIME_PARSING,
     UNIX_MILLISECONDS_INTEGER_DATETIME_PARSING,
+    CompiledSchema,
+    CompiledTransformer,
+    ParallelTransformer,
+    TransformResult,
     Transformer,
+    compile_metadata_filter,
+    compile_schema,
     transform,
     _transform_datetime,
     resolve_schema_references
@@ -0,0 +1,206 @@
+import gzip
+import io
+import itertools
+import os
+import tempfile
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from singer.messages import (
+    DEFAULT_RECORDS_CHUNK_SIZE,
+    MessageReader,
+    _format_records,
+    write_batch,
+)
+
+DEFAULT_BATCH_RECORDS = 100000
+DEFAULT_READ_BUFFER_BYTES = 1048576
+GZIP_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+
+# Every target can read gzip. zstd compresses faster and smaller, but
+# needs the zstandard package on both sides, so it is opt-in.
+DEFAULT_COMPRESSION = 'gzip'
+
+_SUFFIXES = {
+    None: '.jsonl',
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+
+
+def _check_compression(compression):
+    if compression not in _SUFFIXES:
+        raise ValueError(f'Unsupported batch compression: {compression}')
+    if compression == 'zstd' and zstandard is None:
+        raise Exception('zstd compression requires the zstandard package')
+
+
+class BatchWriter():
+    '''Writes the records of a stream to batch files and emits BATCH messages.
+
+    Records are written as RECORD message lines to a file in directory,
+    compressed with gzip (the default), zstd or not at all. A file is
+    finished once it holds max_records records or, if max_bytes is set,
+    max_bytes of uncompressed lines, and then a BATCH message pointing to
+    it, with its batch_size, is written with write_batch. close() finishes the last
+    file, and batches lists the (filepath, batch_size) of all finished
+    files. The directory defaults to the system's temporary directory.
+
+    with singer.BatchWriter('users', directory='/data/batches') as writer:
+        writer.write_records(users)
+
+    '''
+
+    def __init__(self, stream_name, directory=None, compression=DEFAULT_COMPRESSION,
+                 max_records=DEFAULT_BATCH_RECORDS, max_bytes=None, stream_alias=None,
+                 time_extracted=None):
+        _check_compression(compression)
+        self.stream_name = stream_alias or stream_name
+        self.directory = directory
+        self.compression = compression
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.time_extracted = time_extracted
+        self.file = None
+        self._raw = None
+        self.filepath = None
+        self.record_count = 0
+        self.byte_count = 0
+        self.batches = []
+
+    def _open(self):
+        prefix = self.stream_name.replace(os.sep, '_') + '-'
+        fd, self.filepath = tempfile.mkstemp(prefix=prefix,
+                                             suffix=_SUFFIXES[self.compression],
+                                             dir=self.directory)
+        raw = os.fdopen(fd, 'wb')
+        if self.compression == 'gzip':
+            self.file = gzip.GzipFile(fileobj=raw, mode='wb',
+                                      compresslevel=GZIP_COMPRESSION_LEVEL)
+            self._raw = raw
+        elif self.compression == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL)
+            self.file = compressor.stream_writer(raw)
+            self._raw = None
+        else:
+            self.file = raw
+            self._raw = None
+        self.record_count = 0
+        self.byte_count = 0
+
+    def write_record(self, record):
+        '''Writes a single record.'''
+        self.write_records((record,))
+
+    def write_records(self, records):
+        '''Writes records, finishing files as they fill up.'''
+        records = iter(records)
+        while True:
+            room = self.max_records
+            if self.file is not None:
+                room -= self.record_count
+            chunk_size = min(DEFAULT_RECORDS_CHUNK_SIZE, room)
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            # Opened only now, so no empty file is left after a rotation
+            if self.file is None:
+                self._open()
+            for data, count in _format_records(self.stream_name, chunk,
+                                               self.time_extracted, chunk_size):
+                self.file.write(data)
+                self.record_count += count
+                self.byte_count += len(data)
+            if (self.record_count >= self.max_records
+                    or (self.max_bytes is not None and self.byte_count >= self.max_bytes)):
+                self.finish()
+
+    def finish(self):
+        '''Closes the current file and writes its BATCH message.'''
+        if self.file is None:
+            return
+        self.file.close()
+        if self._raw is not None:
+            self._raw.close()
+        self.file = self._raw = None
+        if self.record_count == 0:
+            os.remove(self.filepath)
+            return
+        write_batch(self.stream_name, self.filepath, file_format='jsonl',
+                    compression=self.compression, batch_size=self.record_count,
+                    time_extracted=self.time_extracted)
+        self.batches.append((self.filepath, self.record_count))
+
+    def close(self):
+        self.finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BatchReader():
+    '''Reads the records of a batch file written by a BatchWriter.
+
+    The file is decompressed according to compression, which defaults to
+    the one its name suffix implies, and read in chunks of buffer_size
+    bytes. Iterating a BatchReader yields the records, messages() yields
+    the RECORD messages themselves.
+
+    for message in singer.MessageReader():
+        if isinstance(message, singer.BatchMessage):
+            for record in singer.BatchReader.from_message(message):
+                ...
+
+    '''
+
+    def __init__(self, filepath, compression=None, buffer_size=DEFAULT_READ_BUFFER_BYTES):
+        if compression is None:
+            if filepath.endswith('.gz'):
+                compression = 'gzip'
+            elif filepath.endswith('.zst'):
+                compression = 'zstd'
+        _check_compression(compression)
+        self.filepath = filepath
+        self.compression = compression
+        self.buffer_size = buffer_size
+
+    @classmethod
+    def from_message(cls, message, buffer_size=DEFAULT_READ_BUFFER_BYTES):
+        '''Returns a BatchReader for the file of a BatchMessage.'''
+        if message.format != 'jsonl':
+            raise ValueError(f'Unsupported batch format: {message.format}')
+        return cls(message.filepath, compression=message.compression, buffer_size=buffer_size)
+
+    def lines(self):
+        '''Yields the decompressed, non-empty lines of the file.'''
+        with open(self.filepath, 'rb', buffering=self.buffer_size) as raw:
+            if self.compression == 'gzip':
+                stream = io.BufferedReader(gzip.GzipFile(fileobj=raw, mode='rb'),
+                                           self.buffer_size)
+            elif self.compression == 'zstd':
+                stream = io.BufferedReader(
+                    zstandard.ZstdDecompressor().stream_reader(raw, closefd=False),
+                    self.buffer_size)
+            else:
+                stream = raw
+            with stream:
+                for line in stream:
+                    if line != b'\n':
+                        yield line
+
+    def __iter__(self):
+        for line in self.lines():
+            yield orjson.loads(line)['record']
+
+    def messages(self, lazy=False):
+        '''Yields the RECORD messages of the file.'''
+        return MessageReader(self.lines(), lazy=lazy)
@@ -1,18 +1,257 @@
+import atexit
+import copy
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import threading
+import time
 
+# Use the default logging conf that meets the singer specs criteria
+_DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'logging.conf')
 
-def get_logger(name='singer'):
-    """Return a Logger instance to use in singer."""
+# Logging config applied last, as (path, use_queue)
+_CONFIGURED = None
+_CONFIGURE_LOCK = threading.Lock()
+
+# Set by set_queue_logging, overrides LOGGING_USE_QUEUE
+_USE_QUEUE = None
+_QUEUE_LISTENER = None
+
+
+def _config():
     # Use custom logging config provided by environment variable
-    if 'LOGGING_CONF_FILE' in os.environ and os.environ['LOGGING_CONF_FILE']:
-        path = os.environ['LOGGING_CONF_FILE']
-        logging.config.fileConfig(path, disable_existing_loggers=False)
-    # Use the default logging conf that meets the singer specs criteria
-    else:
-        this_dir, _ = os.path.split(__file__)
-        path = os.path.join(this_dir, 'logging.conf')
-        logging.config.fileConfig(path, disable_existing_loggers=False)
+    path = os.environ.get('LOGGING_CONF_FILE') or _DEFAULT_CONFIG_PATH
+    use_queue = _USE_QUEUE
+    if use_queue is None:
+        use_queue = os.environ.get('LOGGING_USE_QUEUE', '').lower() in ('1', 'true', 'yes')
+    return path, use_queue
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''QueueHandler that leaves formatting to the listener's handlers.
+
+    QueueHandler.prepare formats the whole record in the logging thread.
+    Only the message is interpolated here, so later changes to the
+    arguments don't show up in it.
+    '''
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _start_queue_listener():
+    global _QUEUE_LISTENER  # pylint: disable=global-statement
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    _QUEUE_LISTENER = logging.handlers.QueueListener(log_queue, *handlers,
+                                                     respect_handler_level=True)
+    _QUEUE_LISTENER.start()
+
+
+@atexit.register
+def _stop_queue_listener():
+    '''Stops the listener after it handled all queued records.'''
+    global _QUEUE_LISTENER  # pylint: disable=global-statement
+    if _QUEUE_LISTENER is not None:
+        _QUEUE_LISTENER.stop()
+        _QUEUE_LISTENER = None
+
+
+def _restore_handlers_after_fork():
+    # The listener thread doesn't exist in a forked child, so records put
+    # in the queue would never be handled. Log directly there instead.
+    global _CONFIGURE_LOCK, _QUEUE_LISTENER  # pylint: disable=global-statement
+    _CONFIGURE_LOCK = threading.Lock()
+    if _QUEUE_LISTENER is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+    for handler in _QUEUE_LISTENER.handlers:
+        root.addHandler(handler)
+    _QUEUE_LISTENER = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restore_handlers_after_fork)
+
+
+def _configure(config):
+    global _CONFIGURED  # pylint: disable=global-statement
+    path, use_queue = config
+    _stop_queue_listener()
+    logging.config.fileConfig(path, disable_existing_loggers=False)
+    if use_queue:
+        _start_queue_listener()
+    _CONFIGURED = config
+
+
+def get_logger(name='singer'):
+    """Return a Logger instance to use in singer.
+
+    The logging config file is applied on the first call, and again only
+    when the LOGGING_CONF_FILE or LOGGING_USE_QUEUE environment variables
+    change, so getting a logger is cheap.
+    """
+    config = _config()
+    if config != _CONFIGURED:
+        with _CONFIGURE_LOCK:
+            if config != _CONFIGURED:
+                _configure(config)
 
     return logging.getLogger(name)
+
+
+def reconfigure():
+    """Apply the logging config file again.
+
+    Call it after changing the config file itself, or to undo changes
+    made to the loggers since it was applied.
+    """
+    with _CONFIGURE_LOCK:
+        _configure(_config())
+
+
+def set_queue_logging(enabled):
+    """Whether the root logger's handlers run in a background thread.
+
+    When enabled, the handlers configured for the root logger are moved
+    to a QueueListener thread and the root logger only puts records in
+    its queue. Logging calls then don't wait for formatting and writing
+    to stderr. Records still queued at exit are handled before the
+    interpreter shuts logging down. Pass None to fall back to the
+    LOGGING_USE_QUEUE environment variable, which is off by default.
+    """
+    global _USE_QUEUE  # pylint: disable=global-statement
+    _USE_QUEUE = enabled
+    reconfigure()
+
+
+DEFAULT_SAMPLE_FIRST = 10
+DEFAULT_SUMMARY_INTERVAL = 60
+
+
+class LogSampler():
+    '''Logs the first occurrences of a message, then only counts them.
+
+    Occurrences are keyed by message template and path, e.g. the
+    breadcrumb of the field a warning is about. The first first
+    occurrences of each key are logged as usual. Later ones are only
+    counted, and a summary with the count of the ones not logged is
+    logged at most every interval seconds per key, when the key occurs
+    again, and by flush(). Arguments of occurrences that are not logged
+    are never formatted. A sampler in a worker process can send the
+    result of pop_counts() to the parent's sampler, which merge()s it
+    into its summaries.
+
+    sampler = singer.LogSampler(LOGGER)
+    for record in records:
+        if 'updated_at' not in record:
+            sampler.warning('Missing updated_at in %s', record['id'], path=('updated_at',))
+    sampler.flush()
+
+    '''
+
+    def __init__(self, logger=None, first=DEFAULT_SAMPLE_FIRST,
+                 interval=DEFAULT_SUMMARY_INTERVAL):
+        self.logger = logger or get_logger()
+        self.first = first
+        self.interval = interval
+        # (level, template, path) -> [occurrences, not logged since the last
+        # summary, time of the last summary, occurrences at the last
+        # pop_counts]
+        self._occurrences = {}
+        self._lock = threading.Lock()
+
+    def log(self, level, template, *args, path=None):
+        '''Logs template % args at level, or counts it.'''
+        if not self.logger.isEnabledFor(level):
+            return
+
+        key = (level, template, path)
+        summary = None
+        with self._lock:
+            state = self._occurrences.get(key)
+            if state is None:
+                state = self._occurrences[key] = [0, 0, time.monotonic(), 0]
+            state[0] += 1
+            occurrences = state[0]
+            if occurrences > self.first:
+                state[1] += 1
+                now = time.monotonic()
+                if now - state[2] >= self.interval:
+                    summary = state[1]
+                    state[1] = 0
+                    state[2] = now
+
+        if occurrences <= self.first:
+            self.logger.log(level, template, *args)
+        elif summary is not None:
+            self._log_summary(key, summary, occurrences)
+
+    def warning(self, template, *args, path=None):
+        self.log(logging.WARNING, template, *args, path=path)
+
+    def _log_summary(self, key, not_logged, occurrences):
+        level, template, path = key
+        self.logger.log(level, '%s more occurrences of "%s" at %s not logged, %s in total',
+                        not_logged, template, '.'.join(map(str, path or ())) or '<root>',
+                        occurrences)
+
+    def flush(self):
+        '''Logs the summaries of all occurrences not logged yet.'''
+        summaries = []
+        with self._lock:
+            now = time.monotonic()
+            for key, state in self._occurrences.items():
+                if state[1]:
+                    summaries.append((key, state[1], state[0]))
+                    state[1] = 0
+                    state[2] = now
+
+        for key, not_logged, occurrences in summaries:
+            self._log_summary(key, not_logged, occurrences)
+
+    def pop_counts(self):
+        '''Returns and resets the counts of occurrences not logged yet.
+
+        The result maps each key to its occurrences and occurrences not
+        logged since the last call, and can be passed to merge().
+        '''
+        counts = {}
+        with self._lock:
+            for key, state in self._occurrences.items():
+                if state[1]:
+                    counts[key] = (state[0] - state[3], state[1])
+                    state[1] = 0
+                state[3] = state[0]
+        return counts
+
+    def merge(self, counts):
+        '''Adds the result of pop_counts() of another sampler.'''
+        summaries = []
+        with self._lock:
+            now = time.monotonic()
+            for key, (occurrences, not_logged) in counts.items():
+                state = self._occurrences.get(key)
+                if state is None:
+                    state = self._occurrences[key] = [0, 0, now, 0]
+                state[0] += occurrences
+                state[1] += not_logged
+                if now - state[2] >= self.interval:
+                    summaries.append((key, state[1], state[0]))
+                    state[1] = 0
+                    state[2] = now
+
+        for key, not_logged, occurrences in summaries:
+            self._log_summary(key, not_logged, occurrences)
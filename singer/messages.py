@@ -1,4 +1,17 @@
+import asyncio
+import atexit
+import collections
+import functools
+import itertools
+import json
+import operator
+import os
+import queue
+import re
+import secrets
 import sys
+import threading
+import time
 
 import pytz
 import orjson
@@ -9,12 +22,86 @@ import singer.utils as u
 from .logger import get_logger
 LOGGER = get_logger()
 
+DEFAULT_BUFFER_BYTES = 65536
+DEFAULT_RECORDS_CHUNK_SIZE = 1000
+DEFAULT_QUEUE_SIZE = 16
+
+# MessageWriter used by write_message, see set_message_writer
+_MESSAGE_WRITER = None
+
+# Start of every RECORD serialized by format_message
+_RECORD_PREFIX = b'{"type":"RECORD","stream":'
+
+# How format_message serializes decimal.Decimal values, see set_decimal_mode
+DECIMAL_AS_FLOAT = 'float'
+DECIMAL_EXACT = 'exact'
+_DECIMAL_MODE = DECIMAL_AS_FLOAT
+
+# orjson >= 3.9 inserts Fragments into the output as they are
+_FRAGMENT = getattr(orjson, 'Fragment', None)
+
+# Older orjson: exact Decimals are serialized as strings starting with
+# _DECIMAL_MARKER and unquoted afterwards. The marker is random, so record
+# values can't imitate it. An unescaped quote only occurs outside of
+# strings, so the lookbehind skips quotes that are part of one, and the
+# lookahead skips object keys.
+_DECIMAL_MARKER = '\x00Decimal' + secrets.token_hex(8) + '\x00'
+_DECIMAL_MARKER_JSON = orjson.dumps(_DECIMAL_MARKER)[1:-1]
+_DECIMAL_MARKER_RE = re.compile(
+    rb'(?<=[:,\[\s])"' + re.escape(_DECIMAL_MARKER_JSON) + rb'([-+.0-9Ee]+)"(?!:)')
+
 class Message():
-    '''Base class for messages.'''
+    '''Base class for messages.
+
+    A message parsed with parse_message(msg, keep_source=True) keeps the
+    line it was parsed from in source. format_message returns the source
+    instead of serializing the message again, unless the message is
+    dirty: one of its attributes was assigned since, or mark_dirty() was
+    called. Changes made in place, like updating a key of a RECORD's
+    record, can't be detected, so call mark_dirty() after making them.
+    A LazyRecordMessage is dirty once its record was decoded, so it
+    doesn't need that.
+
+    Message types define __slots__ to keep their instances small, so a
+    tap or target holding many of them in memory doesn't pay for a
+    __dict__ per message. Attributes other than the message fields can't
+    be set on them.
+    '''
+
+    __slots__ = ()
+
+    # Attributes that must be unchanged to reuse the source
+    _source_fields = ()
+
+    # Defaults for subclasses that don't define __slots__
+    source = None
+    _source_state = None
 
     def asdict(self):  # pylint: disable=no-self-use
         raise Exception('Not implemented')
 
+    def set_source(self, source):
+        '''Keeps source, the serialized message without a newline.'''
+        self.source = source
+        self._source_state = operator.attrgetter(*self._source_fields)(self)
+
+    def mark_dirty(self):
+        '''Drops the source, so the message is serialized again.'''
+        self.source = None
+        self._source_state = None
+
+    @property
+    def dirty(self):
+        '''Whether the message has no source or was changed since it was set.'''
+        if self.source is None:
+            return True
+
+        state = operator.attrgetter(*self._source_fields)(self)
+        if len(self._source_fields) == 1:
+            return state is not self._source_state
+
+        return not all(map(operator.is_, state, self._source_state))
+
     def __eq__(self, other):
         return isinstance(other, Message) and self.asdict() == other.asdict()
 
@@ -44,7 +131,12 @@ class RecordMessage(Message):
 
     '''
 
+    __slots__ = ('stream', 'record', 'version', 'time_extracted', 'source', '_source_state')
+
+    _source_fields = ('stream', 'record', 'version', 'time_extracted')
+
     def __init__(self, stream, record, version=None, time_extracted=None):
+        self.source = None
         self.stream = stream
         self.record = record
         self.version = version
@@ -62,14 +154,100 @@ class RecordMessage(Message):
         if self.version is not None:
             result['version'] = self.version
         if self.time_extracted:
-            as_utc = self.time_extracted.astimezone(pytz.utc)
-            result['time_extracted'] = u.strftime(as_utc)
+            result['time_extracted'] = _format_time_extracted(self.time_extracted)
         return result
 
     def __str__(self):
         return str(self.asdict())
 
 
+@functools.lru_cache(maxsize=256)
+def _format_time_extracted(time_extracted):
+    '''Format time_extracted in UTC.
+
+    Taps stamp many messages with the same extraction time, so the string
+    is cached per distinct datetime.
+    '''
+    return u.strftime(time_extracted.astimezone(pytz.utc))
+
+
+# Marks a LazyRecordMessage record that was not decoded yet
+_UNDECODED = object()
+
+
+class LazyRecordMessage(RecordMessage):
+    '''RECORD message that decodes its record on first access.
+
+    parse_message(msg, lazy=True) returns LazyRecordMessages so targets
+    that only route, count or pass records through don't pay for decoding
+    them. raw_record keeps the serialized record, and format_message
+    reuses it, and the source of a message parsed with keep_source, as
+    long as the record was not accessed. With exact_numbers
+    the record is decoded like parse_message(msg, exact_numbers=True)
+    does.
+
+    msg = singer.LazyRecordMessage(
+        stream='users',
+        raw_record=b'{"id":1,"name":"Mary"}')
+
+    '''
+
+    __slots__ = ('raw_record', '_record', 'exact_numbers')
+
+    _source_fields = ('stream', 'raw_record', 'version', 'time_extracted')
+
+    def __init__(self, stream, raw_record, version=None, time_extracted=None,
+                 exact_numbers=False):
+        super().__init__(stream, _UNDECODED, version=version, time_extracted=time_extracted)
+        self.raw_record = raw_record
+        self.exact_numbers = exact_numbers
+
+    @property
+    def record(self):
+        if self._record is _UNDECODED:
+            if self.exact_numbers:
+                self._record = _loads_exact(self.raw_record)
+            else:
+                self._record = orjson.loads(self.raw_record)
+        return self._record
+
+    @record.setter
+    def record(self, value):
+        if self.source is not None:
+            self.mark_dirty()
+        self._record = value
+
+    @property
+    def decoded(self):
+        '''Whether the record was decoded.'''
+        return self._record is not _UNDECODED
+
+    @property
+    def dirty(self):
+        # A decoded record may have been changed in place
+        return self.decoded or super().dirty
+
+    # The record property would decode the record and its setter reads
+    # source, so copies and pickles use the slots behind it instead
+    _state_slots = ('stream', 'raw_record', '_record', 'version', 'time_extracted',
+                    'exact_numbers', 'source', '_source_state')
+
+    def __getstate__(self):
+        state = {}
+        for name in self._state_slots:
+            # Leaves out unset slots and the undecoded marker, which is
+            # only itself within this process
+            value = getattr(self, name, _UNDECODED)
+            if value is not _UNDECODED:
+                state[name] = value
+        return state
+
+    def __setstate__(self, state):
+        self._record = _UNDECODED
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
 class SchemaMessage(Message):
     '''SCHEMA message.
 
@@ -90,7 +268,14 @@ class SchemaMessage(Message):
         key_properties=['id'])
 
     '''
+
+    __slots__ = ('stream', 'schema', 'key_properties', 'bookmark_properties',
+                 'source', '_source_state')
+
+    _source_fields = ('stream', 'schema', 'key_properties', 'bookmark_properties')
+
     def __init__(self, stream, schema, key_properties, bookmark_properties=None):
+        self.source = None
         self.stream = stream
         self.schema = schema
         self.key_properties = key_properties
@@ -125,7 +310,13 @@ class StateMessage(Message):
         value={'users': '2017-06-19T00:00:00'})
 
     '''
+
+    __slots__ = ('value', 'source', '_source_state')
+
+    _source_fields = ('value',)
+
     def __init__(self, value):
+        self.source = None
         self.value = value
 
     def asdict(self):
@@ -156,7 +347,13 @@ class ActivateVersionMessage(Message):
         version=2)
 
     '''
+
+    __slots__ = ('stream', 'version', 'source', '_source_state')
+
+    _source_fields = ('stream', 'version')
+
     def __init__(self, stream, version):
+        self.source = None
         self.stream = stream
         self.version = version
 
@@ -194,10 +391,16 @@ class BatchMessage(Message):
 
     """
 
+    __slots__ = ('stream', 'filepath', 'format', 'compression', 'batch_size', 'time_extracted',
+                 'source', '_source_state')
+
+    _source_fields = ('stream', 'filepath', 'format', 'compression', 'batch_size', 'time_extracted')
+
     def __init__(
         self, stream, filepath, file_format=None, compression=None,
         batch_size=None, time_extracted=None
     ):
+        self.source = None
         self.stream = stream
         self.filepath = filepath
         self.format = file_format or 'jsonl'
@@ -220,8 +423,7 @@ class BatchMessage(Message):
         if self.batch_size is not None:
             result['batch_size'] = self.batch_size
         if self.time_extracted:
-            as_utc = self.time_extracted.astimezone(pytz.utc)
-            result['time_extracted'] = u.strftime(as_utc)
+            result['time_extracted'] = _format_time_extracted(self.time_extracted)
         return result
 
 
@@ -232,32 +434,152 @@ def _required_key(msg, k):
     return msg[k]
 
 
-def parse_message(msg):
-    """Parse a message string into a Message object."""
+def _record_time_extracted(obj):
+    time_extracted = obj.get('time_extracted')
+    if time_extracted:
+        try:
+            time_extracted = ciso8601.parse_datetime(time_extracted)
+        except Exception:
+            LOGGER.warning('unable to parse time_extracted with ciso8601 library')
+            time_extracted = None
+
+
+        # time_extracted = dateutil.parser.parse(time_extracted)
+    return time_extracted
+
+
+# Deletes everything but the brackets and quotes of JSON text
+_NON_STRUCTURAL_BYTES = bytes(c for c in range(256) if c not in b'{}[]"')
+_JSON_ESCAPE_RE = re.compile(rb'\\.', re.DOTALL)
+# A string once the escapes are dropped
+_JSON_STRING_RE = re.compile(rb'"[^"]*"')
+
+
+def _is_single_object(data):
+    '''Whether data, which starts with { and ends with }, is one JSON object
+    and not an object followed by more keys of an enclosing one.'''
+    # More keys after the object would need another object, as data ends
+    # with a }
+    if data.find(b'{', 1) == -1:
+        return True
+
+    if b'\\' in data:
+        data = _JSON_ESCAPE_RE.sub(b'', data)
+    skeleton = data.translate(None, _NON_STRUCTURAL_BYTES).replace(b'""', b'')
+    if b'"' in skeleton:
+        # Some strings contain brackets, drop the strings first
+        skeleton = _JSON_STRING_RE.sub(b'', data).translate(None, _NON_STRUCTURAL_BYTES)
+
+    # The brackets between the outer ones must be balanced
+    inner = skeleton[1:-1]
+    while inner:
+        reduced = inner.replace(b'{}', b'').replace(b'[]', b'')
+        if len(reduced) == len(inner):
+            return False
+        inner = reduced
+    return True
+
+
+def _parse_lazy_record(msg, exact_numbers=False):
+    '''Return a LazyRecordMessage if msg, without trailing whitespace, is a
+    RECORD laid out like the output of format_message, otherwise None.'''
+    if not msg.startswith(_RECORD_PREFIX):
+        return None
+
+    # A JSON string can't contain an unescaped quote, so the first match
+    # after the stream name is the record key
+    record_key = msg.find(b',"record":{', len(_RECORD_PREFIX))
+    if record_key == -1:
+        return None
+
+    end = len(msg)
+    if msg[end - 1] != ord('}'):
+        return None
+
+    # The optional version and time_extracted come after the record, so the
+    # last matching keys are the envelope's even if the record has them too
+    tail = end - 1
+    if msg[tail - 1] == ord('"'):
+        tail = msg.rfind(b',"time_extracted":"', record_key, tail)
+    if tail > 0 and msg[tail - 1] in b'0123456789':
+        tail = msg.rfind(b',"version":', record_key, tail)
+    if tail <= 0 or msg[tail - 1] != ord('}'):
+        return None
+
+    raw_record = msg[record_key + len(b',"record":'):tail]
+    if not _is_single_object(raw_record):
+        return None
+
+    try:
+        envelope = orjson.loads(msg[:record_key] + msg[tail:end])
+    except orjson.JSONDecodeError:
+        return None
+
+    return LazyRecordMessage(stream=_required_key(envelope, 'stream'),
+                             raw_record=raw_record,
+                             version=envelope.get('version'),
+                             time_extracted=_record_time_extracted(envelope),
+                             exact_numbers=exact_numbers)
+
+
+def _loads_exact(data):
+    '''Decode JSON with numbers that have a fraction or an exponent as Decimals.
+
+    orjson only decodes floats, and converting them to Decimals afterwards
+    costs more than the C scanner of the json module takes to decode the
+    Decimals from their text.
+    '''
+    return json.loads(data, parse_float=decimal.Decimal)
 
-    # We are not using Decimals for parsing here.
-    # We recognize that exposes data to potentially
-    # lossy conversions.  However, this will affect
-    # very few data points and we have chosen to
-    # leave conversion as is for now.
-    obj = orjson.loads(msg)
-    msg_type = _required_key(obj, 'type')
 
-    if msg_type == 'RECORD':
-        time_extracted = obj.get('time_extracted')
-        if time_extracted:
-            try:
-                time_extracted = ciso8601.parse_datetime(time_extracted)
-            except Exception:
-                LOGGER.warning('unable to parse time_extracted with ciso8601 library')
-                time_extracted = None
+def parse_message(msg, lazy=False, keep_source=False, exact_numbers=False):
+    """Parse a message string into a Message object.
 
+    With lazy=True, RECORD messages in the layout written by
+    format_message are returned as LazyRecordMessages, without decoding
+    the record. Any other message is parsed as usual.
 
-            # time_extracted = dateutil.parser.parse(time_extracted)
+    With keep_source=True the message keeps msg as its source, which
+    format_message reuses while the message is not dirty.
+
+    With exact_numbers=True, numbers with a fraction or an exponent are
+    decoded as Decimals with exactly their digits instead of floats, and
+    integers of any size are decoded. That's slower, but a lazy record is
+    only decoded when it is accessed. Use set_decimal_mode(DECIMAL_EXACT)
+    to write them back without losing precision.
+    """
+    if lazy or keep_source:
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        elif not isinstance(msg, bytes):
+            msg = bytes(msg)
+        msg = msg.rstrip()
+
+    message = None
+    if lazy:
+        message = _parse_lazy_record(msg, exact_numbers)
+    if message is None and exact_numbers:
+        message = _message_from_obj(_loads_exact(msg))
+    elif message is None:
+        # We are not using Decimals for parsing here unless
+        # exact_numbers is set. We recognize that exposes data
+        # to potentially lossy conversions.  However, this will
+        # affect very few data points and we have chosen to
+        # leave conversion as is by default.
+        message = _message_from_obj(orjson.loads(msg))
+    if keep_source and message is not None:
+        message.set_source(msg)
+    return message
+
+
+def _message_from_obj(obj):
+    msg_type = _required_key(obj, 'type')
+
+    if msg_type == 'RECORD':
         return RecordMessage(stream=_required_key(obj, 'stream'),
                              record=_required_key(obj, 'record'),
                              version=obj.get('version'),
-                             time_extracted=time_extracted)
+                             time_extracted=_record_time_extracted(obj))
 
     if msg_type == 'SCHEMA':
         return SchemaMessage(stream=_required_key(obj, 'stream'),
@@ -292,19 +614,573 @@ def parse_message(msg):
 
     return None
 
-def format_message(message, option=0):
-    def default(obj):
-        if isinstance(obj, decimal.Decimal):
-            return int(obj) if float(obj).is_integer() else float(obj)
-        raise TypeError
-    
-    return orjson.dumps(message.asdict(), option=option, default=default)
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        as_float = float(obj)
+        return int(obj) if as_float.is_integer() else as_float
+    raise TypeError
+
+
+def _exact_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        if not obj.is_finite():
+            return None
+        if _FRAGMENT is not None:
+            return _FRAGMENT(str(obj))
+        return _DECIMAL_MARKER + str(obj)
+    raise TypeError
+
+
+def _dumps(obj, option=0, decimal_mode=None):
+    '''Serialize obj with orjson, converting Decimals as decimal_mode says.'''
+    if (decimal_mode or _DECIMAL_MODE) != DECIMAL_EXACT:
+        return orjson.dumps(obj, option=option, default=_default)
+
+    serialized = orjson.dumps(obj, option=option, default=_exact_default)
+    if _FRAGMENT is None and _DECIMAL_MARKER_JSON in serialized:
+        # Joining the split keeps the captured numbers, much faster than sub
+        serialized = b''.join(_DECIMAL_MARKER_RE.split(serialized))
+    return serialized
+
+
+def set_decimal_mode(mode):
+    """Set how decimal.Decimal values are serialized and return the previous mode.
+
+    DECIMAL_AS_FLOAT (default) writes integral Decimals as integers and
+    the others as floats, which is fast but rounds values that don't fit
+    in a float. DECIMAL_EXACT writes every Decimal as a JSON number with
+    exactly the digits of str(value). NaN and infinite Decimals are
+    written as null in both modes.
+    """
+    global _DECIMAL_MODE  # pylint: disable=global-statement
+    if mode not in (DECIMAL_AS_FLOAT, DECIMAL_EXACT):
+        raise ValueError(f'Unknown decimal mode: {mode}')
+    previous = _DECIMAL_MODE
+    _DECIMAL_MODE = mode
+    return previous
+
+
+class MessageReader():
+    '''Reads and parses messages from a binary stream.
+
+    Targets usually decode stdin to text and parse it line by line. A
+    MessageReader iterates the lines of the binary stream, which splits
+    them in C without decoding, and passes the bytes straight to orjson.
+    Messages are parsed lazily while iterating and empty lines are
+    skipped. lazy, keep_source and exact_numbers are passed on to
+    parse_message. The stream defaults to sys.stdin.buffer.
+
+    for message in singer.MessageReader():
+        if isinstance(message, singer.RecordMessage):
+            ...
+
+    '''
+
+    def __init__(self, stream=None, lazy=False, keep_source=False, exact_numbers=False):
+        self.stream = stream
+        self.lazy = lazy
+        self.keep_source = keep_source
+        self.exact_numbers = exact_numbers
+
+    def __iter__(self):
+        if self.lazy or self.keep_source or self.exact_numbers:
+            for line in self.lines():
+                yield parse_message(line, lazy=self.lazy, keep_source=self.keep_source,
+                                    exact_numbers=self.exact_numbers)
+            return
+
+        for line in self.lines():
+            yield _message_from_obj(orjson.loads(line))
+
+    def lines(self):
+        '''Yields the non-empty lines of the stream as bytes.'''
+        for line in self.stream or sys.stdin.buffer:
+            if line != b'\n':
+                yield line
+
+
+def format_message(message, option=0, decimal_mode=None):
+    '''Serialize message to bytes.
+
+    decimal_mode overrides the mode set with set_decimal_mode for this
+    message.
+    '''
+    if message.source is not None and not option & ~orjson.OPT_APPEND_NEWLINE \
+            and not message.dirty:
+        return message.source + b'\n' if option else message.source
+
+    # RECORDs of a stream share their envelope, only the record is serialized
+    message_type = type(message)
+    if ((message_type is RecordMessage or message_type is LazyRecordMessage)
+            and not option & ~orjson.OPT_APPEND_NEWLINE):
+        prefix, suffix = _record_envelope(message.stream, message.version, message.time_extracted)
+        if option:
+            suffix += b'\n'
+        if message_type is LazyRecordMessage and not message.decoded:
+            return prefix + message.raw_record + suffix
+        return prefix + _dumps(message.record, decimal_mode=decimal_mode) + suffix
+
+    return _dumps(message.asdict(), option=option, decimal_mode=decimal_mode)
+
+
+# Typed, so versions 1, 1.0 and True are serialized as themselves
+@functools.lru_cache(maxsize=256, typed=True)
+def _record_envelope(stream_name, version=None, time_extracted=None):
+    '''Return the serialized bytes before and after the record of a RECORD message.'''
+    placeholder = orjson.dumps(RecordMessage(stream=stream_name,
+                                             record=0,
+                                             version=version,
+                                             time_extracted=time_extracted).asdict())
+    # A JSON string can't contain an unescaped quote, so the first match is
+    # the record key and not part of the stream name
+    record_start = placeholder.index(b',"record":0') + len(b',"record":')
+    return placeholder[:record_start], placeholder[record_start + 1:]
+
+
+class MessageWriter():
+    '''Buffers serialized messages and writes them to a binary stream.
+
+    Writing and flushing stdout once per message costs a write syscall for
+    every RECORD. A MessageWriter collects serialized lines in memory and
+    flushes them when any of the configured thresholds is reached:
+
+      * max_bytes - number of buffered bytes
+      * max_messages (optional) - number of buffered messages
+      * max_interval (optional) - seconds elapsed since the last flush,
+        checked when the next message is written. Use a
+        BackgroundMessageWriter to also flush while no messages come in.
+      * flush_on_state - flush right after every STATE message, so the
+        target receives each state checkpoint promptly
+
+    The stream defaults to sys.stdout.buffer. Writes from several threads
+    are serialized by a lock. Install the writer with
+    set_message_writer to make write_record, write_records, write_state,
+    etc. use it:
+
+    with singer.MessageWriter(max_bytes=1048576) as writer:
+        singer.set_message_writer(writer)
+        singer.write_records('users', users)
+        singer.write_state(state)
+
+    '''
+
+    def __init__(self, stream=None, max_bytes=DEFAULT_BUFFER_BYTES, max_messages=None,
+                 max_interval=None, flush_on_state=True):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.max_interval = max_interval
+        self.flush_on_state = flush_on_state
+        self.buffer = bytearray()
+        self.message_count = 0
+        self.last_flush_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write_message(self, message):
+        '''Serializes and buffers a single message.'''
+        self.write(format_message(message, option=orjson.OPT_APPEND_NEWLINE),
+                   is_state=isinstance(message, StateMessage))
+
+    def write(self, data, count=1, is_state=False):
+        '''Buffers already serialized, newline terminated message lines.'''
+        with self._lock:
+            self.buffer += data
+            self.message_count += count
+            if (is_state and self.flush_on_state) or self._ready_to_flush():
+                self._flush()
+
+    def _ready_to_flush(self):
+        if len(self.buffer) >= self.max_bytes:
+            return True
+        if self.max_messages is not None and self.message_count >= self.max_messages:
+            return True
+        if self.max_interval is not None:
+            return time.monotonic() - self.last_flush_time >= self.max_interval
+        return False
+
+    def flush(self):
+        '''Writes all buffered messages to the stream and flushes it.'''
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Called with the lock held
+        if self.buffer:
+            stream = self.stream or sys.stdout.buffer
+            stream.write(self.buffer)
+            stream.flush()
+            self.buffer.clear()
+        self.message_count = 0
+        self.last_flush_time = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+class BackgroundMessageWriter(MessageWriter):
+    '''MessageWriter that writes to the stream from a background thread.
+
+    When the target reads slowly, writing to stdout blocks the tap until
+    the pipe drains. A BackgroundMessageWriter buffers messages like a
+    MessageWriter, but hands each full buffer to a thread through a queue
+    of at most max_queue_size buffers, so extraction goes on while the
+    thread writes. Once the queue is full, writes block until the thread
+    catches up.
+
+    With max_interval, the thread also writes messages that were buffered
+    for max_interval seconds while no more came in, e.g. while the tap
+    waits for a slow API.
+
+    flush() waits until the thread wrote everything. So writing a STATE
+    message with flush_on_state, replacing the installed writer and
+    exiting the interpreter all drain the queue first. An error raised
+    while writing is raised again by the next write or flush.
+
+    with singer.BackgroundMessageWriter() as writer:
+        singer.set_message_writer(writer)
+        singer.write_records('users', users)
+        singer.write_state(state)
+
+    '''
+
+    def __init__(self, stream=None, max_bytes=DEFAULT_BUFFER_BYTES, max_messages=None,
+                 max_interval=None, flush_on_state=True, max_queue_size=DEFAULT_QUEUE_SIZE):
+        super().__init__(stream, max_bytes=max_bytes, max_messages=max_messages,
+                         max_interval=max_interval, flush_on_state=flush_on_state)
+        self.queue = queue.Queue(max_queue_size)
+        self.thread = None
+        self.error = None
+
+    def write(self, data, count=1, is_state=False):
+        '''Buffers already serialized, newline terminated message lines.'''
+        self._raise_error()
+        with self._lock:
+            self.buffer += data
+            self.message_count += count
+            if is_state and self.flush_on_state:
+                self._flush()
+            elif self._ready_to_flush():
+                self._enqueue()
+            elif self.max_interval is not None and self.thread is None:
+                # The thread flushes the buffer once max_interval passed
+                self._start()
+
+    def _start(self):
+        self.thread = threading.Thread(target=self._run,
+                                       name='singer-message-writer',
+                                       daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _enqueue(self):
+        # Called with the lock held
+        if self.buffer:
+            if self.thread is None:
+                self._start()
+            # Blocks while the queue is full
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.message_count = 0
+        self.last_flush_time = time.monotonic()
+
+    def _run(self):
+        stream = self.stream or sys.stdout.buffer
+        while True:
+            try:
+                data = self.queue.get(timeout=self._idle_timeout())
+            except queue.Empty:
+                self._flush_idle(stream)
+                continue
+            try:
+                if data is None:
+                    return
+                if self.error is None:
+                    stream.write(data)
+                    if self.queue.empty():
+                        stream.flush()
+            except Exception as exc:  # pylint: disable=broad-except
+                self.error = exc
+            finally:
+                self.queue.task_done()
+
+    def _idle_timeout(self):
+        if self.max_interval is None:
+            return None
+        if not self.buffer:
+            return self.max_interval
+        return max(self.last_flush_time + self.max_interval - time.monotonic(), 0)
+
+    def _flush_idle(self, stream):
+        with self._lock:
+            # Buffers in the queue were buffered before this one
+            if (not self.buffer or not self.queue.empty()
+                    or time.monotonic() - self.last_flush_time < self.max_interval):
+                return
+            if self.error is None:
+                try:
+                    stream.write(self.buffer)
+                    stream.flush()
+                except Exception as exc:  # pylint: disable=broad-except
+                    self.error = exc
+            self.buffer.clear()
+            self.message_count = 0
+            self.last_flush_time = time.monotonic()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise Exception('Writing messages in the background failed') from self.error
+
+    def _flush(self):
+        # Writes all buffered messages and waits until the thread wrote them
+        if self.thread is None:
+            # Nothing was handed to the thread yet
+            super()._flush()
+            return
+        self._enqueue()
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        '''Flushes and stops the thread.'''
+        with self._lock:
+            if self.thread is None:
+                super()._flush()
+                return
+            try:
+                self._flush()
+            finally:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+                atexit.unregister(self.flush)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _PipeProtocol(asyncio.BaseProtocol):
+    '''Tracks flow control and the end of the connection of a write pipe.'''
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.paused = False
+        # Futures of the tasks waiting in drain()
+        self.waiters = collections.deque()
+        self.closed = loop.create_future()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._wake_waiters()
+
+    def connection_lost(self, exc):
+        self.paused = False
+        self._wake_waiters()
+        self.closed.set_result(exc)
+
+    def _wake_waiters(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def drain(self):
+        '''Waits until the transport's buffer is below its high-water mark.'''
+        if self.paused:
+            waiter = self.loop.create_future()
+            self.waiters.append(waiter)
+            await waiter
+
+
+class AsyncMessageWriter():
+    '''Writes messages from asyncio code without blocking the event loop.
+
+    The write_* coroutines mirror the module's write_* functions. Messages
+    are buffered until max_bytes are buffered or a STATE message is
+    written with flush_on_state, and then written to a non-blocking pipe
+    transport. Awaiting a write waits for the transport to drain only
+    while the reader lags behind, which gives backpressure without
+    blocking the loop. Several tasks can write through the same writer.
+
+    The stream defaults to sys.stdout.buffer. It must be a pipe, socket
+    or character device to be written asynchronously. For anything else,
+    like a regular file, the writer falls back to writing synchronously.
+    While a writer is open its file descriptor is non-blocking, so write
+    all messages through it, and close it when done:
+
+    async with singer.AsyncMessageWriter() as writer:
+        await writer.write_schema('users', schema, ['id'])
+        async for page in fetch_users():
+            await writer.write_records('users', page)
+        await writer.write_state(state)
+
+    '''
+
+    def __init__(self, stream=None, max_bytes=DEFAULT_BUFFER_BYTES, flush_on_state=True):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.flush_on_state = flush_on_state
+        self.buffer = bytearray()
+        self.message_count = 0
+        self.transport = None
+        self.protocol = None
+        self.asynchronous = None
+        # Created in the loop, it serializes connecting and writing
+        self._lock = None
+
+    async def _connect(self):
+        stream = self.stream or sys.stdout.buffer
+        stream.flush()
+        loop = asyncio.get_running_loop()
+        pipe = None
+        try:
+            # A duplicate, so closing the transport doesn't close stream
+            pipe = open(os.dup(stream.fileno()), 'wb', buffering=0)
+            self.transport, self.protocol = await loop.connect_write_pipe(
+                lambda: _PipeProtocol(loop), pipe)
+        except (OSError, ValueError):
+            if pipe is not None:
+                pipe.close()
+            self.asynchronous = False
+            return
+        self.asynchronous = True
+
+    async def write_message(self, message):
+        '''Serializes and buffers a single message.'''
+        await self.write(format_message(message, option=orjson.OPT_APPEND_NEWLINE),
+                         is_state=isinstance(message, StateMessage))
+
+    async def write(self, data, count=1, is_state=False):
+        '''Buffers already serialized, newline terminated message lines.'''
+        self.buffer += data
+        self.message_count += count
+        if (is_state and self.flush_on_state) or len(self.buffer) >= self.max_bytes:
+            await self.flush()
+
+    async def write_record(self, stream_name, record, stream_alias=None, time_extracted=None):
+        await self.write_message(RecordMessage(stream=(stream_alias or stream_name),
+                                               record=record,
+                                               time_extracted=time_extracted))
+
+    async def write_records(self, stream_name, records, stream_alias=None, time_extracted=None,
+                            chunk_size=DEFAULT_RECORDS_CHUNK_SIZE):
+        for data, count in _format_records(stream_alias or stream_name, records,
+                                           time_extracted, chunk_size):
+            await self.write(data, count=count)
+
+    async def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None,
+                           stream_alias=None):
+        await self.write_message(_schema_message(stream_name, schema, key_properties,
+                                                 bookmark_properties, stream_alias))
+
+    async def write_state(self, value):
+        await self.write_message(StateMessage(value=value))
+
+    async def write_version(self, stream_name, version):
+        await self.write_message(ActivateVersionMessage(stream_name, version))
+
+    async def flush(self):
+        '''Writes all buffered messages and waits while the transport is full.'''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.buffer:
+                if self.asynchronous is None:
+                    await self._connect()
+                if self.asynchronous:
+                    if self.transport.is_closing():
+                        # After a write error connection_lost is called soon
+                        exc = await self.protocol.closed
+                        raise Exception('The pipe was closed') from exc
+                    self.transport.write(bytes(self.buffer))
+                else:
+                    stream = self.stream or sys.stdout.buffer
+                    stream.write(self.buffer)
+                    stream.flush()
+                self.buffer.clear()
+            self.message_count = 0
+        if self.protocol is not None:
+            await self.protocol.drain()
+
+    async def close(self):
+        '''Flushes, waits until everything was written and closes the transport.
+
+        The stream is made blocking again even if flushing fails.
+        '''
+        try:
+            await self.flush()
+        finally:
+            exc = await self._disconnect()
+        if exc is not None:
+            raise Exception('Writing messages to the pipe failed') from exc
+
+    async def _disconnect(self):
+        exc = None
+        if self.transport is not None:
+            # Closing writes the transport's buffer first
+            self.transport.close()
+            exc = await self.protocol.closed
+            self.transport = self.protocol = None
+            os.set_blocking((self.stream or sys.stdout.buffer).fileno(), True)
+        self.asynchronous = None
+        return exc
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def set_message_writer(writer):
+    """Use writer for all subsequent write_* calls and return the previous one.
+
+    Pass None to go back to writing and flushing every message directly to
+    stdout. The previous writer is flushed before it is replaced and the
+    installed writer is flushed when the interpreter exits.
+    """
+    global _MESSAGE_WRITER  # pylint: disable=global-statement
+    previous = _MESSAGE_WRITER
+    if previous is not None:
+        previous.flush()
+    _MESSAGE_WRITER = writer
+    return previous
+
+
+def get_message_writer():
+    """Return the MessageWriter used by write_* calls or None."""
+    return _MESSAGE_WRITER
+
+
+@atexit.register
+def _flush_message_writer():
+    if _MESSAGE_WRITER is not None:
+        _MESSAGE_WRITER.flush()
+
 
 def write_message(message):
+    if _MESSAGE_WRITER is not None:
+        _MESSAGE_WRITER.write_message(message)
+        return
+
     sys.stdout.buffer.write(format_message(message, option=orjson.OPT_APPEND_NEWLINE))
     sys.stdout.buffer.flush()
 
 
+def _write_lines(data, count):
+    if _MESSAGE_WRITER is not None:
+        _MESSAGE_WRITER.write(data, count=count)
+        return
+
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+
 def write_record(stream_name, record, stream_alias=None, time_extracted=None):
     """Write a single record for the given stream.
 
@@ -315,15 +1191,33 @@ def write_record(stream_name, record, stream_alias=None, time_extracted=None):
                                 time_extracted=time_extracted))
 
 
-def write_records(stream_name, records):
+def write_records(stream_name, records, stream_alias=None, time_extracted=None,
+                  chunk_size=DEFAULT_RECORDS_CHUNK_SIZE):
     """Write a list of records for the given stream.
 
+    Records are serialized in chunks of chunk_size and every chunk is
+    written with a single write, reusing the serialized message envelope.
+
     chris = {"id": 1, "email": "chris@stitchdata.com"}
     mike = {"id": 2, "email": "mike@stitchdata.com"}
     write_records("users", [chris, mike])
     """
-    for record in records:
-        write_record(stream_name, record)
+    for data, count in _format_records(stream_alias or stream_name, records,
+                                       time_extracted, chunk_size):
+        _write_lines(data, count)
+
+
+def _format_records(stream_name, records, time_extracted, chunk_size):
+    '''Yield the RECORD lines of records in chunks of chunk_size, with their count.'''
+    prefix, suffix = _record_envelope(stream_name, time_extracted=time_extracted)
+    suffix += b'\n'
+    separator = suffix + prefix
+    records = iter(records)
+    while True:
+        serialized = [_dumps(record) for record in itertools.islice(records, chunk_size)]
+        if not serialized:
+            break
+        yield prefix + separator.join(serialized) + suffix, len(serialized)
 
 
 def write_schema(stream_name, schema, key_properties, bookmark_properties=None, stream_alias=None):
@@ -334,17 +1228,21 @@ def write_schema(stream_name, schema, key_properties, bookmark_properties=None,
     key_properties = ['id']
     write_schema(stream, schema, key_properties)
     """
+    write_message(_schema_message(stream_name, schema, key_properties,
+                                  bookmark_properties, stream_alias))
+
+
+def _schema_message(stream_name, schema, key_properties, bookmark_properties, stream_alias):
     if isinstance(key_properties, (str, bytes)):
         key_properties = [key_properties]
     if not isinstance(key_properties, list):
         raise Exception('key_properties must be a string or list of strings')
 
-    write_message(
-        SchemaMessage(
-            stream=(stream_alias or stream_name),
-            schema=schema,
-            key_properties=key_properties,
-            bookmark_properties=bookmark_properties))
+    return SchemaMessage(
+        stream=(stream_alias or stream_name),
+        schema=schema,
+        key_properties=key_properties,
+        bookmark_properties=bookmark_properties)
 
 
 def write_state(value):
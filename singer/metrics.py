@@ -38,15 +38,31 @@ commonly used metrics.
   * job_timer - Emits a 'job_duration' metric to track time of
     asynchronous jobs. Provides "job_type" tag.
 
+MetricsRegistry collects counters and timers from many threads, and from
+worker processes that send their deltas back, and emits them from one
+place:
+
+    with MetricsRegistry() as registry:
+        records = registry.counter('record_count', {'endpoint': 'users'})
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            ...  # records.increment() in any thread
+
 '''
 
 import orjson
+import os
 import re
+import threading
 import time
+import weakref
 from collections import namedtuple
 from singer.logger import get_logger
 
 DEFAULT_LOG_INTERVAL = 60
+DEFAULT_LOCK_STRIPES = 16
+
+# Counters with shorter log intervals check the clock on every increment
+TICKER_MIN_LOG_INTERVAL = 1
 
 
 class Status:
@@ -120,11 +136,21 @@ class Counter():
         self.log_interval = log_interval
         self.logger = get_logger()
         self.last_log_time = time.time()
+        # Whether _ready_to_log needs to check the clock, set by the ticker
+        # once log_interval has passed
+        self._due = True
+        self._tick()
 
     def __enter__(self):
         self.last_log_time = time.time()
+        self._tick()
         return self
 
+    def _tick(self):
+        if self.log_interval >= TICKER_MIN_LOG_INTERVAL:
+            self._due = False
+            _TICKER.register(self)
+
     def increment(self, amount=1):
         '''Increments value by the specified amount.'''
         self.value += amount
@@ -135,12 +161,72 @@ class Counter():
         log(self.logger, Point('counter', self.metric, self.value, self.tags))
         self.value = 0
         self.last_log_time = time.time()
+        self._tick()
 
     def __exit__(self, exc_type, exc_value, traceback):
         self._pop()
+        _TICKER.unregister(self)
+        self._due = True
 
     def _ready_to_log(self):
-        return time.time() - self.last_log_time > self.log_interval
+        return self._due and time.time() - self.last_log_time > self.log_interval
+
+
+class _CounterTicker():
+    '''Flags counters whose log interval has passed.
+
+    A daemon thread sleeps until the next counter is due and sets its
+    _due flag, so Counter.increment doesn't have to read the clock until
+    then. Counters register again after each log, with their new
+    last_log_time.
+    '''
+
+    def __init__(self):
+        self.counters = weakref.WeakSet()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def register(self, counter):
+        with self.condition:
+            self.counters.add(counter)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='singer-metrics-ticker',
+                                               daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def unregister(self, counter):
+        with self.condition:
+            self.counters.discard(counter)
+
+    def _run(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                timeout = None
+                for counter in list(self.counters):
+                    if counter._due:  # pylint: disable=protected-access
+                        continue
+                    remaining = counter.last_log_time + counter.log_interval - now
+                    if remaining < 0:
+                        counter._due = True  # pylint: disable=protected-access
+                    elif timeout is None or remaining < timeout:
+                        timeout = remaining
+                self.condition.wait(timeout)
+
+    def after_fork(self):
+        # The thread doesn't exist in a forked child. Its counters check
+        # the clock until their next log registers them again.
+        for counter in list(self.counters):
+            counter._due = True  # pylint: disable=protected-access
+        self.counters = weakref.WeakSet()
+        self.condition = threading.Condition()
+        self.thread = None
+
+
+_TICKER = _CounterTicker()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_TICKER.after_fork)
 
 
 class Timer():  # pylint: disable=too-few-public-methods
@@ -193,6 +279,185 @@ class Timer():  # pylint: disable=too-few-public-methods
         log(self.logger, Point('timer', self.metric, self.elapsed(), self.tags))
 
 
+class _RegistryCounter():  # pylint: disable=too-few-public-methods
+    def __init__(self, registry, metric, tags):
+        self.registry = registry
+        self.key = _metric_key(metric, tags)
+        self.stripe = registry._stripe(self.key)  # pylint: disable=protected-access
+
+    def increment(self, amount=1):
+        '''Increments the counter by the specified amount.'''
+        self.registry._add_count(self.key, amount, self.stripe)  # pylint: disable=protected-access
+
+
+class _RegistryTimer():  # pylint: disable=too-few-public-methods
+    def __init__(self, registry, metric, tags):
+        self.registry = registry
+        self.metric = metric
+        self.tags = tags if tags else {}
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        status = Status.succeeded if exc_type is None else Status.failed
+        tags = dict(self.tags)
+        tags.setdefault(Tag.status, status)
+        self.registry.observe(self.metric, time.time() - self.start_time, tags)
+
+
+def _metric_key(metric, tags):
+    return metric, tuple(sorted(tags.items())) if tags else ()
+
+
+class MetricsRegistry():
+    '''Collects counter and timer metrics from many threads and processes.
+
+    Counters are summed per metric and tags, under one of stripes locks
+    picked by the key's hash, so threads incrementing different counters
+    rarely contend. Timer durations are kept per metric and tags until
+    they are emitted. emit() logs the points collected since the last
+    emit, like Counter and Timer do. While the registry is used as a
+    context manager, a daemon thread emits them every log_interval
+    seconds, and they are emitted once more on exit.
+
+    Worker processes use a registry of their own and send the result of
+    pop_deltas() back to the parent, which passes it to merge():
+
+    def extract(page):
+        ...
+        return records, WORKER_REGISTRY.pop_deltas()
+
+    records, deltas = future.result()
+    registry.merge(deltas)
+
+    '''
+
+    def __init__(self, log_interval=DEFAULT_LOG_INTERVAL, stripes=DEFAULT_LOCK_STRIPES):
+        self.log_interval = log_interval
+        self.logger = get_logger()
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._counts = [{} for _ in range(stripes)]
+        self._timings = [{} for _ in range(stripes)]
+        self._emitter = None
+        self._stopped = threading.Event()
+        _REGISTRIES.add(self)
+
+    def _stripe(self, key):
+        return hash(key) % len(self._locks)
+
+    def _add_count(self, key, amount, stripe=None):
+        if stripe is None:
+            stripe = self._stripe(key)
+        with self._locks[stripe]:
+            # pop_deltas replaces the dicts under the lock
+            counts = self._counts[stripe]
+            counts[key] = counts.get(key, 0) + amount
+
+    def increment(self, metric, tags=None, amount=1):
+        '''Increments the counter for metric and tags by amount.'''
+        self._add_count(_metric_key(metric, tags), amount)
+
+    def observe(self, metric, seconds, tags=None):
+        '''Records a duration for the timer of metric and tags.'''
+        key = _metric_key(metric, tags)
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            self._timings[stripe].setdefault(key, []).append(seconds)
+
+    def counter(self, metric, tags=None):
+        '''Returns a counter with an increment method, bound to this registry.'''
+        return _RegistryCounter(self, metric, tags)
+
+    def timer(self, metric, tags=None):
+        '''Returns a Timer-like context manager that records to this registry.'''
+        return _RegistryTimer(self, metric, tags)
+
+    def pop_deltas(self):
+        '''Returns and resets the counts and durations collected so far.
+
+        The result is picklable and can be passed to merge() of another
+        registry.
+        '''
+        counts, timings = {}, {}
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                stripe_counts, self._counts[stripe] = self._counts[stripe], {}
+                stripe_timings, self._timings[stripe] = self._timings[stripe], {}
+            counts.update(stripe_counts)
+            timings.update(stripe_timings)
+        return counts, timings
+
+    def merge(self, deltas):
+        '''Adds the result of pop_deltas() of another registry.'''
+        counts, timings = deltas
+        for key, amount in counts.items():
+            self._add_count(key, amount)
+        for key, durations in timings.items():
+            stripe = self._stripe(key)
+            with self._locks[stripe]:
+                self._timings[stripe].setdefault(key, []).extend(durations)
+
+    def emit(self):
+        '''Logs a point per counter and per duration collected since the last emit.'''
+        counts, timings = self.pop_deltas()
+        for (metric, tags), value in counts.items():
+            log(self.logger, Point('counter', metric, value, dict(tags)))
+        for (metric, tags), durations in timings.items():
+            for duration in durations:
+                log(self.logger, Point('timer', metric, duration, dict(tags)))
+
+    def _run(self):
+        while not self._stopped.wait(self.log_interval):
+            self.emit()
+
+    def start(self):
+        '''Starts emitting every log_interval seconds in a daemon thread.'''
+        if self._emitter is None:
+            self._stopped.clear()
+            self._emitter = threading.Thread(target=self._run, name='singer-metrics-emitter',
+                                             daemon=True)
+            self._emitter.start()
+
+    def stop(self):
+        '''Stops the emitter thread and emits what is left.'''
+        if self._emitter is not None:
+            self._stopped.set()
+            self._emitter.join()
+            self._emitter = None
+        self.emit()
+
+    def _after_fork(self):
+        # A forked child starts empty, so its deltas don't repeat the
+        # parent's, and without the parent's emitter thread
+        self._locks = [threading.Lock() for _ in self._locks]
+        self._counts = [{} for _ in self._locks]
+        self._timings = [{} for _ in self._locks]
+        self._emitter = None
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+_REGISTRIES = weakref.WeakSet()
+
+
+def _registries_after_fork():
+    for registry in list(_REGISTRIES):
+        registry._after_fork()  # pylint: disable=protected-access
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_registries_after_fork)
+
+
 def record_counter(endpoint=None, log_interval=DEFAULT_LOG_INTERVAL):
     '''Use for counting records retrieved from the source.
 
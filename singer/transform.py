@@ -1,14 +1,23 @@
+import collections
+import concurrent.futures
 import datetime
+import itertools
 import logging
 import re
+from collections import namedtuple
+
+import ciso8601
 from jsonschema import RefResolver
 
 import singer.metadata
-from singer.logger import get_logger
+from singer.logger import LogSampler, get_logger
 from singer.utils import (strftime, strptime_to_utc)
 
 LOGGER = get_logger()
 
+# Unparsable date-times are logged a few times per field, then summarized
+DATETIME_WARNINGS = LogSampler(LOGGER)
+
 NO_INTEGER_DATETIME_PARSING = 'no-integer-datetime-parsing'
 UNIX_SECONDS_INTEGER_DATETIME_PARSING = 'unix-seconds-integer-datetime-parsing'
 UNIX_MILLISECONDS_INTEGER_DATETIME_PARSING = 'unix-milliseconds-integer-datetime-parsing'
@@ -20,11 +29,41 @@ VALID_DATETIME_FORMATS = [
 ]
 
 
-def string_to_datetime(value):
+# Shortest RFC3339 date-time, e.g. 2017-01-01T00:00:00Z
+RFC3339_MIN_LENGTH = 20
+
+
+def _parse_rfc3339(value):
+    if not isinstance(value, str) or len(value) < RFC3339_MIN_LENGTH:
+        return None
+
+    try:
+        return ciso8601.parse_rfc3339(value)
+    except ValueError:
+        return None
+
+
+def _is_canonical_datetime(value):
+    # Same layout as strftime's output, e.g. 2017-01-01T00:00:00.000000Z
+    return len(value) == 27 and value[10] == 'T' and value[19] == '.' and value[26] == 'Z'
+
+
+def string_to_datetime(value, path=None):
     try:
-        return strftime(strptime_to_utc(value))
+        dtime = _parse_rfc3339(value)
+        if dtime is None:
+            # Not RFC3339, fall back to dateutil which guesses the format
+            return strftime(strptime_to_utc(value))
+
+        if _is_canonical_datetime(value):
+            return value
+
+        return strftime(dtime.astimezone(datetime.timezone.utc))
     except Exception as ex:
-        LOGGER.warning('%s, (%s)', ex, value)
+        # Array indexes are dropped so all items of an array share a path
+        if path is not None:
+            path = tuple(key for key in path if not isinstance(key, int))
+        DATETIME_WARNINGS.warning('%s, (%s)', ex, value, path=path)
         return None
 
 
@@ -47,6 +86,49 @@ class SchemaMismatch(Exception):
 
         super().__init__(msg)
 
+TransformResult = namedtuple('TransformResult', ['record', 'errors'])
+
+# Placeholder for keys missing from a record in a pivoted column
+_MISSING = object()
+
+# Values of these Python types are returned as they are by the converter of
+# the matching JSON schema type
+_COLUMN_FAST_TYPES = {
+    'integer': int,
+    'number': float,
+    'string': str,
+    'boolean': bool,
+}
+
+
+def _column_fast_path(schema):
+    '''Returns the Python type whose values a property schema keeps as they
+    are, or None, and whether it also keeps None values.'''
+    if SchemaKey.any_of in schema or 'type' not in schema or schema.get('format'):
+        return None, False
+
+    types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+    non_null_types = [typ for typ in types if typ != 'null']
+    if len(non_null_types) != 1 or non_null_types[0] not in _COLUMN_FAST_TYPES:
+        return None, False
+
+    # bool(None) is False, so booleans never get to the 'null' type
+    return (_COLUMN_FAST_TYPES[non_null_types[0]],
+            'null' in types and non_null_types[0] != 'boolean')
+
+
+def _is_columnar_schema(schema):
+    '''Whether records of the schema can be transformed column-wise.'''
+    if (SchemaKey.any_of in schema or schema.get(SchemaKey.pattern_properties)
+            or schema.get('format') or not schema.get(SchemaKey.properties)):
+        return False
+
+    types = schema.get('type')
+    if not isinstance(types, list):
+        types = [types]
+    return [typ for typ in types if typ != 'null'] == ['object']
+
+
 class SchemaKey:
     ref = '$ref'
     items = 'items'
@@ -78,14 +160,61 @@ class Error:
         return output
 
 
+# Number of distinct keys a _PatternIndex remembers the matches of
+PATTERN_INDEX_MAX_KEYS = 10000
+
+# Number of patternProperties dicts a Transformer keeps _PatternIndexes for
+PATTERN_INDEX_CACHE_SIZE = 128
+
+
+class _PatternIndex():
+    '''Resolves object keys against compiled patternProperties.
+
+    patterns is an iterable of (pattern, item) pairs. The items of all
+    patterns matching a key are passed to resolve, and its result is
+    remembered for that key, so every distinct key is matched only once.
+    '''
+
+    def __init__(self, patterns, resolve):
+        self.patterns = [(re.compile(pattern), item) for pattern, item in patterns]
+        self.resolve = resolve
+        self.resolved = {}
+
+    def get(self, key):
+        try:
+            return self.resolved[key]
+        except KeyError:
+            pass
+
+        value = self.resolve([item for regex, item in self.patterns if regex.match(key)])
+        if len(self.resolved) < PATTERN_INDEX_MAX_KEYS:
+            self.resolved[key] = value
+        return value
+
+
+def _anyof_schema(pattern_schemas):
+    return {SchemaKey.any_of: pattern_schemas} if pattern_schemas else None
+
+
 class Transformer:
-    def __init__(self, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING, pre_hook=None):
+    def __init__(self, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING, pre_hook=None,
+                 datetime_cache_size=None):
         self.integer_datetime_fmt = integer_datetime_fmt
         self.pre_hook = pre_hook
         self.removed = set()
         self.filtered = set()
         self.errors = []
 
+        # Optional LRU cache of raw date-time values (strings and integer
+        # epochs) to their normalized string, for low cardinality columns
+        self.datetime_cache_size = datetime_cache_size
+        self.datetime_cache = collections.OrderedDict() if datetime_cache_size else None
+        self.datetime_cache_hits = 0
+        self.datetime_cache_misses = 0
+        self._datetime_cache_fmt = integer_datetime_fmt
+
+        self._pattern_indexes = collections.OrderedDict()
+
     def log_warning(self):
         if self.filtered:
             LOGGER.debug('Filtered %s paths during transforms '
@@ -103,6 +232,13 @@ class Transformer:
             # Output list format to parse for reporting
             LOGGER.debug('Removed paths list: %s', sorted(self.removed))
 
+        DATETIME_WARNINGS.flush()
+
+        if self.datetime_cache is not None:
+            LOGGER.debug('Date-time cache: %s hits, %s misses',
+                         self.datetime_cache_hits,
+                         self.datetime_cache_misses)
+
     def __enter__(self):
         return self
 
@@ -111,6 +247,13 @@ class Transformer:
 
     def filter_data_by_metadata(self, data, metadata):
         if isinstance(data, dict) and metadata:
+            if isinstance(metadata, frozenset):
+                # Fields to drop precomputed by compile_metadata_filter
+                for field_name in metadata.intersection(data):
+                    del data[field_name]
+                    self.filtered.add(field_name)
+                return data
+
             for field_name in list(data.keys()):
                 selected = singer.metadata.get(metadata, ('properties', field_name), 'selected')
                 inclusion = singer.metadata.get(metadata, ('properties', field_name), 'inclusion')
@@ -134,12 +277,158 @@ class Transformer:
     def transform(self, data, schema, metadata=None):
         data = self.filter_data_by_metadata(data, metadata)
 
-        success, transformed_data = self.transform_recur(data, schema, [])
+        if isinstance(schema, CompiledSchema):
+            success, transformed_data = schema.converter(self, data, [])
+        else:
+            success, transformed_data = self.transform_recur(data, schema, [])
         if not success:
             raise SchemaMismatch(self.errors)
 
         return transformed_data
 
+    def transform_many(self, records, schema, metadata=None):
+        '''Transforms a batch of records of the same schema.
+
+        The schema and metadata are compiled once for the whole batch and
+        a record that doesn't match the schema doesn't stop the batch.
+        Returns a TransformResult for every record, in order. Its errors
+        are None if the record was transformed, otherwise record is None
+        and errors is the list of Errors for that record.
+        '''
+        if not isinstance(schema, CompiledSchema):
+            schema = compile_schema(schema)
+        if metadata and not isinstance(metadata, frozenset):
+            metadata = compile_metadata_filter(metadata)
+
+        converter = schema.converter
+        results = []
+        for data in records:
+            errors_start = len(self.errors)
+            data = self.filter_data_by_metadata(data, metadata)
+            success, transformed_data = converter(self, data, [])
+            if success:
+                results.append(TransformResult(transformed_data, None))
+            else:
+                results.append(TransformResult(None, self.errors[errors_start:]))
+
+        return results
+
+    def transform_columnar(self, records, schema, metadata=None):
+        '''Transforms a batch of flat records one column at a time.
+
+        Returns the same TransformResults as transform_many. The records
+        are pivoted into one list per property, every column is converted
+        by transform_columns and the result is pivoted back into records.
+        Batches that can't be transformed column-wise, because the schema
+        isn't a plain object schema, a pre_hook is set or a record isn't a
+        dict, are passed on to transform_many.
+        '''
+        if not isinstance(schema, CompiledSchema):
+            schema = compile_schema(schema)
+        records = list(records)
+        if (self.pre_hook or not _is_columnar_schema(schema.schema)
+                or not all(isinstance(record, dict) for record in records)):
+            # Not self.transform_many, which CompiledTransformer overrides
+            # without the schema argument
+            return Transformer.transform_many(self, records, schema, metadata=metadata)
+
+        columns = {}
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [_MISSING] * len(records)
+                column[i] = value
+
+        if metadata:
+            if not isinstance(metadata, frozenset):
+                metadata = compile_metadata_filter(metadata)
+            for field_name in metadata.intersection(columns):
+                del columns[field_name]
+                self.filtered.add(field_name)
+
+        columns, failures = self.transform_columns(columns, schema)
+
+        results = []
+        for i, record in enumerate(records):
+            if i in failures:
+                errors = failures[i]
+                errors.append(Error([], record, schema.schema, logging_level=LOGGER.level))
+                self.errors.append(errors[-1])
+                results.append(TransformResult(None, errors))
+            else:
+                results.append(TransformResult({key: columns[key][i] for key in record if key in columns},
+                                               None))
+
+        return results
+
+    def transform_columns(self, columns, schema):
+        '''Transforms columns of values of a flat object schema.
+
+        columns is a dict of property name to the list of values of that
+        property, with one value per row in every list. Each column is
+        converted with a single loop: values that already have the type
+        of the property are kept as they are, repeated date-time strings
+        are converted once, and all other values go through the property's
+        converter.
+
+        Returns the dict of converted columns, without the columns that
+        aren't in the schema, and a dict of row index to the list of
+        Errors of the rows that didn't match the schema.
+        '''
+        if not isinstance(schema, CompiledSchema):
+            schema = compile_schema(schema)
+        properties = schema.schema.get(SchemaKey.properties, {})
+        converters = schema.property_converters()
+
+        result = {}
+        failures = {}
+        for key, values in columns.items():
+            if key not in properties:
+                # see _transform_object
+                self.removed.add(key)
+                continue
+
+            result[key] = self._transform_column(values, properties[key], converters[key], [key],
+                                                 failures)
+
+        return result, failures
+
+    def _transform_column(self, values, schema, converter, path, failures):
+        fast_type, null_passthrough = None, False
+        memo = None
+        if not self.pre_hook:
+            fast_type, null_passthrough = _column_fast_path(schema)
+            if schema.get('format') == 'date-time':
+                memo = {}
+
+        result = []
+        append = result.append
+        errors = self.errors
+        for i, value in enumerate(values):
+            if type(value) is fast_type or value is _MISSING:  # pylint: disable=unidiomatic-typecheck
+                append(value)
+                continue
+            if value is None and null_passthrough:
+                append(None)
+                continue
+            if memo is not None and type(value) is str:  # pylint: disable=unidiomatic-typecheck
+                converted = memo.get(value)
+                if converted is not None:
+                    append(converted)
+                    continue
+
+            errors_start = len(errors)
+            success, converted = converter(self, value, path)
+            if success:
+                if memo is not None and type(value) is str:  # pylint: disable=unidiomatic-typecheck
+                    memo[value] = converted
+            else:
+                failures.setdefault(i, []).extend(errors[errors_start:])
+            append(converted)
+
+        return result
+
     def transform_recur(self, data, schema, path):
         if 'anyOf' in schema:
             return self._transform_anyof(data, schema, path)
@@ -187,15 +476,20 @@ class Transformer:
         if schema == {} and not pattern_properties:
             return True, data
 
+        # patternProperties are a map of {"pattern": { schema...}}
+        pattern_index = self._pattern_index(pattern_properties) if pattern_properties else None
+
         result = {}
         successes = []
         for key, value in data.items():
-            # patternProperties are a map of {"pattern": { schema...}}
-            pattern_schemas = [schema for pattern, schema
-                               in (pattern_properties or {}).items()
-                               if re.match(pattern, key)]
-            if key in schema or pattern_schemas:
-                sub_schema = schema.get(key, {'anyOf': pattern_schemas})
+            if key in schema:
+                sub_schema = schema[key]
+            elif pattern_index is not None:
+                sub_schema = pattern_index.get(key)
+            else:
+                sub_schema = None
+
+            if sub_schema is not None:
                 success, subdata = self.transform_recur(value, sub_schema, path + [key])
                 successes.append(success)
                 result[key] = subdata
@@ -209,6 +503,22 @@ class Transformer:
 
         return all(successes), result
 
+    def _pattern_index(self, pattern_properties):
+        indexes = self._pattern_indexes
+        key = id(pattern_properties)
+        entry = indexes.get(key)
+        # Keep the dict in the entry so its id can't be reused by another one
+        if entry is None or entry[0] is not pattern_properties:
+            entry = (pattern_properties,
+                     _PatternIndex(pattern_properties.items(), _anyof_schema))
+            indexes[key] = entry
+            # Least recently used first, so schemas built per record don't
+            # pile up
+            if len(indexes) > PATTERN_INDEX_CACHE_SIZE:
+                indexes.popitem(last=False)
+        indexes.move_to_end(key)
+        return entry[1]
+
     def _transform_array(self, data, schema, path):
         # We do not necessarily have a list to transform here. The schema's
         # type could contain multiple possible values. Eg:
@@ -224,7 +534,32 @@ class Transformer:
 
         return all(successes), result
 
-    def _transform_datetime(self, value):
+    def _transform_datetime(self, value, path=None):
+        cache = self.datetime_cache
+        if cache is None or type(value) not in (str, int):  # pylint: disable=unidiomatic-typecheck
+            return self._transform_datetime_uncached(value, path)
+
+        if self._datetime_cache_fmt != self.integer_datetime_fmt:
+            cache.clear()
+            self._datetime_cache_fmt = self.integer_datetime_fmt
+
+        try:
+            result = cache[value]
+        except KeyError:
+            self.datetime_cache_misses += 1
+            result = self._transform_datetime_uncached(value, path)
+            # Don't cache failures, they are logged every time
+            if result is not None:
+                cache[value] = result
+                if len(cache) > self.datetime_cache_size:
+                    cache.popitem(last=False)
+            return result
+
+        self.datetime_cache_hits += 1
+        cache.move_to_end(value)
+        return result
+
+    def _transform_datetime_uncached(self, value, path=None):
         if value is None or value == '':
             return None # Short circuit in the case of null or empty string
 
@@ -232,7 +567,7 @@ class Transformer:
             raise Exception('Invalid integer datetime parsing option')
 
         if self.integer_datetime_fmt == NO_INTEGER_DATETIME_PARSING:
-            return string_to_datetime(value)
+            return string_to_datetime(value, path)
 
         try:
             if self.integer_datetime_fmt == UNIX_SECONDS_INTEGER_DATETIME_PARSING:
@@ -240,7 +575,7 @@ class Transformer:
 
             return unix_milliseconds_to_datetime(value)
         except Exception:
-            return string_to_datetime(value)
+            return string_to_datetime(value, path)
 
     def _transform(self, data, typ, schema, path):
         if self.pre_hook:
@@ -253,7 +588,7 @@ class Transformer:
             return False, None
 
         if schema.get('format') == 'date-time':
-            data = self._transform_datetime(data)
+            data = self._transform_datetime(data, path)
             if data is None:
                 return False, None
 
@@ -269,44 +604,278 @@ class Transformer:
         if typ == 'array':
             return self._transform_array(data, schema['items'], path)
 
-        if typ == 'string':
-            if data is not None:
-                try:
-                    return True, str(data)
-                except Exception:
-                    return False, None
-            else:
-                return False, None
+        converter = _SCALAR_CONVERTERS.get(typ)
+        if converter:
+            return converter(self, data, path)
 
-        if typ == 'integer':
-            if isinstance(data, str):
-                data = data.replace(',', '')
+        return False, None
 
-            try:
-                return True, int(data)
-            except Exception:
-                return False, None
 
-        if typ == 'number':
-            if isinstance(data, str):
-                data = data.replace(',', '')
+# Converters are called as converter(transformer, data, path) and return a
+# (success, transformed_data) tuple, like Transformer.transform_recur.
 
-            try:
-                return True, float(data)
-            except Exception:
-                return False, None
+def _convert_null(transformer, data, path):  # pylint: disable=unused-argument
+    if data is None or data == '':
+        return True, None
 
-        if typ == 'boolean':
-            if isinstance(data, str) and data.lower() == 'false':
-                return True, False
+    return False, None
+
+
+def _convert_string(transformer, data, path):  # pylint: disable=unused-argument
+    if data is not None:
+        try:
+            return True, str(data)
+        except Exception:
+            return False, None
+    else:
+        return False, None
+
+
+def _convert_integer(transformer, data, path):  # pylint: disable=unused-argument
+    if isinstance(data, str):
+        data = data.replace(',', '')
+
+    try:
+        return True, int(data)
+    except Exception:
+        return False, None
+
+
+def _convert_number(transformer, data, path):  # pylint: disable=unused-argument
+    if isinstance(data, str):
+        data = data.replace(',', '')
+
+    try:
+        return True, float(data)
+    except Exception:
+        return False, None
+
+
+def _convert_boolean(transformer, data, path):  # pylint: disable=unused-argument
+    if isinstance(data, str) and data.lower() == 'false':
+        return True, False
+
+    try:
+        return True, bool(data)
+    except Exception:
+        return False, None
+
+
+def _convert_datetime(transformer, data, path):
+    data = transformer._transform_datetime(data, path)
+    if data is None:
+        return False, None
+
+    return True, data
 
-            try:
-                return True, bool(data)
-            except Exception:
-                return False, None
 
+def _convert_untyped(transformer, data, path):  # pylint: disable=unused-argument
+    # indicates no typing information so don't bother transforming it
+    return True, data
+
+
+def _convert_unknown(transformer, data, path):  # pylint: disable=unused-argument
+    return False, None
+
+
+def _convert_any_object(transformer, data, path):  # pylint: disable=unused-argument
+    return isinstance(data, dict), data
+
+
+_SCALAR_CONVERTERS = {
+    'string': _convert_string,
+    'integer': _convert_integer,
+    'number': _convert_number,
+    'boolean': _convert_boolean,
+}
+
+
+def _compile_anyof(schema, converters):
+    def convert_anyof(transformer, data, path):
+        for converter in converters:
+            success, transformed_data = converter(transformer, data, path)
+            if success:
+                return success, transformed_data
+        # exhaused all schemas and didn't return, so we failed :-(
+        transformer.errors.append(Error(path, data, schema, logging_level=LOGGER.level))
+        return False, None
+
+    return convert_anyof
+
+
+def _compile_pattern_matches(matches):
+    if not matches:
+        return None
+
+    return _compile_anyof(_anyof_schema([sub_schema for sub_schema, _ in matches]),
+                          [converter for _, converter in matches])
+
+
+def _compile_object(properties, pattern_properties):
+    # Don't touch an empty schema
+    if properties == {} and not pattern_properties:
+        return _convert_any_object
+
+    converters = {key: _compile(sub_schema) for key, sub_schema in properties.items()}
+    pattern_index = None
+    if pattern_properties:
+        pattern_index = _PatternIndex(
+            ((pattern, (sub_schema, _compile(sub_schema)))
+             for pattern, sub_schema in pattern_properties.items()),
+            _compile_pattern_matches)
+
+    def convert_object(transformer, data, path):
+        if not isinstance(data, dict):
+            return False, data
+
+        result = {}
+        success = True
+        for key, value in data.items():
+            converter = converters.get(key)
+            if converter is None and pattern_index is not None:
+                converter = pattern_index.get(key)
+            if converter is None:
+                # see Transformer._transform_object
+                transformer.removed.add('.'.join(map(str, path + [key])))
+                continue
+
+            key_success, result[key] = converter(transformer, value, path + [key])
+            if not key_success:
+                success = False
+
+        return success, result
+
+    return convert_object
+
+
+def _compile_array(schema):
+    if SchemaKey.items not in schema:
+        def convert_array_without_items(transformer, data, path):  # pylint: disable=unused-argument
+            raise KeyError(SchemaKey.items)
+
+        return convert_array_without_items
+
+    item_converter = _compile(schema[SchemaKey.items])
+
+    def convert_array(transformer, data, path):
+        if not isinstance(data, list):
+            return False, data
+
+        result = []
+        success = True
+        for i, row in enumerate(data):
+            row_success, subdata = item_converter(transformer, row, path + [i])
+            if not row_success:
+                success = False
+            result.append(subdata)
+
+        return success, result
+
+    return convert_array
+
+
+def _compile_type(typ, schema):
+    if typ == 'null':
+        return _convert_null
+
+    if schema.get('format') == 'date-time':
+        return _convert_datetime
+
+    if typ == 'object':
+        # Objects do not necessarily specify properties
+        return _compile_object(schema.get(SchemaKey.properties, {}),
+                               schema.get(SchemaKey.pattern_properties))
+
+    if typ == 'array':
+        return _compile_array(schema)
+
+    return _SCALAR_CONVERTERS.get(typ, _convert_unknown)
+
+
+def _compile(schema):
+    if SchemaKey.any_of in schema:
+        return _compile_anyof(schema, [_compile(subschema)
+                                       for subschema in schema[SchemaKey.any_of]])
+
+    if 'type' not in schema:
+        return _convert_untyped
+
+    types = schema['type']
+    if not isinstance(types, list):
+        types = [types]
+
+    # 'null' is always applied last
+    typed_converters = [(typ, _compile_type(typ, schema)) for typ in types if typ != 'null']
+    if 'null' in types:
+        typed_converters.append(('null', _convert_null))
+
+    def convert(transformer, data, path):
+        pre_hook = transformer.pre_hook
+        for typ, converter in typed_converters:
+            value = pre_hook(data, typ, schema) if pre_hook else data
+            success, transformed_data = converter(transformer, value, path)
+            if success:
+                return success, transformed_data
+        # exhaused all types and didn't return, so we failed :-(
+        transformer.errors.append(Error(path, data, schema, logging_level=LOGGER.level))
         return False, None
 
+    return convert
+
+
+class CompiledSchema():
+    '''A JSON schema compiled into a tree of converter functions.
+
+    Transformer.transform_recur inspects the schema for every value it
+    transforms. A CompiledSchema walks the schema once and keeps a
+    converter for every sub-schema, so transforming a record only runs
+    the converters. Use compile_schema to create one and pass it to
+    Transformer.transform instead of the schema dict.
+
+    The schema must not be modified after it was compiled.
+    '''
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.converter = _compile(schema)
+        self._property_converters = None
+
+    def property_converters(self):
+        '''Returns a converter for every property of an object schema.'''
+        if self._property_converters is None:
+            self._property_converters = {
+                key: _compile(sub_schema)
+                for key, sub_schema in self.schema.get(SchemaKey.properties, {}).items()}
+        return self._property_converters
+
+
+def compile_schema(schema):
+    """Compiles a JSON schema for repeated use with Transformer.transform."""
+    return CompiledSchema(schema)
+
+
+class CompiledTransformer(Transformer):
+    '''Transformer for records of a single schema that is compiled once.
+
+    with CompiledTransformer(schema) as transformer:
+        for record in records:
+            singer.write_record('users', transformer.transform(record))
+
+    '''
+
+    def __init__(self, schema, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING, pre_hook=None,
+                 datetime_cache_size=None):
+        super().__init__(integer_datetime_fmt, pre_hook, datetime_cache_size)
+        if not isinstance(schema, CompiledSchema):
+            schema = compile_schema(schema)
+        self.compiled_schema = schema
+
+    def transform(self, data, metadata=None):  # pylint: disable=arguments-differ
+        return super().transform(data, self.compiled_schema, metadata=metadata)
+
+    def transform_many(self, records, metadata=None):  # pylint: disable=arguments-differ
+        return super().transform_many(records, self.compiled_schema, metadata=metadata)
+
 
 def transform(data, schema, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING,
               pre_hook=None, metadata=None):
@@ -330,6 +899,120 @@ def transform(data, schema, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING,
     transformer = Transformer(integer_datetime_fmt, pre_hook)
     return transformer.transform(data, schema, metadata=metadata)
 
+DEFAULT_PARALLEL_CHUNK_SIZE = 1000
+
+# CompiledTransformer of a ParallelTransformer worker process
+_WORKER_TRANSFORMER = None
+
+
+def _init_worker(schema, integer_datetime_fmt, pre_hook, datetime_cache_size):
+    global _WORKER_TRANSFORMER  # pylint: disable=global-statement
+    _WORKER_TRANSFORMER = CompiledTransformer(schema, integer_datetime_fmt, pre_hook,
+                                              datetime_cache_size)
+
+
+def _transform_chunk(records, metadata):
+    transformer = _WORKER_TRANSFORMER
+    results = transformer.transform_many(records, metadata=metadata)
+    # The parent summarizes the date-time warnings this worker didn't log
+    stats = (transformer.removed, transformer.filtered, transformer.errors,
+             DATETIME_WARNINGS.pop_counts())
+    transformer.removed, transformer.filtered, transformer.errors = set(), set(), []
+    return results, stats
+
+
+class ParallelTransformer(CompiledTransformer):
+    '''CompiledTransformer that transforms batches in worker processes.
+
+    transform_many splits the records into chunks of chunk_size and
+    transforms them in a ProcessPoolExecutor. The schema is sent to each
+    worker once, when it starts, and compiled there. Results are returned
+    in the order of the records and the removed and filtered paths and
+    errors of the workers are collected on this transformer. The
+    pre_hook must be picklable, e.g. a module level function.
+
+    with ParallelTransformer(schema, max_workers=4) as transformer:
+        for page in get_pages(...):
+            for result in transformer.transform_many(page):
+                singer.write_record('users', result.record)
+
+    '''
+
+    def __init__(self, schema, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING, pre_hook=None,
+                 datetime_cache_size=None, max_workers=None,
+                 chunk_size=DEFAULT_PARALLEL_CHUNK_SIZE, mp_context=None):
+        super().__init__(schema, integer_datetime_fmt, pre_hook, datetime_cache_size)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.mp_context = mp_context
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.mp_context,
+                initializer=_init_worker,
+                initargs=(self.compiled_schema.schema, self.integer_datetime_fmt,
+                          self.pre_hook, self.datetime_cache_size))
+        return self._executor
+
+    def transform_many(self, records, metadata=None):
+        if metadata and not isinstance(metadata, frozenset):
+            metadata = compile_metadata_filter(metadata)
+
+        records = iter(records)
+        chunks = iter(lambda: list(itertools.islice(records, self.chunk_size)), [])
+
+        results = []
+        for chunk_results, (removed, filtered, errors, warnings) in self.executor.map(
+                _transform_chunk, chunks, itertools.repeat(metadata)):
+            results.extend(chunk_results)
+            self.removed.update(removed)
+            self.filtered.update(filtered)
+            self.errors.extend(errors)
+            DATETIME_WARNINGS.merge(warnings)
+
+        return results
+
+    def close(self):
+        '''Shuts down the worker processes.'''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __exit__(self, *args):
+        try:
+            super().__exit__(*args)
+        finally:
+            self.close()
+
+
+def compile_metadata_filter(metadata):
+    """
+    Returns the frozenset of top level fields that Transformer's metadata
+    filtering drops: fields that are not selected or unsupported, unless
+    their inclusion is automatic.
+
+    Pass the result as metadata to Transformer.transform to filter each
+    record with one set lookup per field instead of metadata lookups.
+    """
+    dropped = set()
+    for breadcrumb, field_metadata in (metadata or {}).items():
+        if len(breadcrumb) != 2 or breadcrumb[0] != 'properties':
+            continue
+
+        inclusion = field_metadata.get('inclusion')
+        if inclusion == 'automatic':
+            continue
+
+        if field_metadata.get('selected') is False or inclusion == 'unsupported':
+            dropped.add(breadcrumb[1])
+
+    return frozenset(dropped)
+
+
 def _transform_datetime(value, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING):
     transformer = Transformer(integer_datetime_fmt)
     return transformer._transform_datetime(value)
@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+import unittest
+
+import singer
+
+
+class TestBatchWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stream = io.BytesIO()
+        singer.set_message_writer(singer.MessageWriter(self.stream))
+
+    def tearDown(self):
+        singer.set_message_writer(None)
+        self.directory.cleanup()
+
+    def batch_messages(self):
+        singer.get_message_writer().flush()
+        return list(singer.MessageReader(io.BytesIO(self.stream.getvalue())))
+
+    def test_rotates_by_record_count(self):
+        records = [{'id': i} for i in range(25)]
+        for compression in (None, 'gzip'):
+            self.stream.seek(0)
+            self.stream.truncate()
+            with singer.BatchWriter('users', directory=self.directory.name,
+                                    compression=compression, max_records=10) as writer:
+                writer.write_records(records[:15])
+                writer.write_records(records[15:])
+
+            messages = self.batch_messages()
+            self.assertEqual([10, 10, 5], [message.batch_size for message in messages])
+            self.assertEqual([(message.filepath, message.batch_size) for message in messages],
+                             writer.batches)
+            for message in messages:
+                self.assertEqual('users', message.stream)
+                self.assertEqual('jsonl', message.format)
+                self.assertEqual(compression, message.compression)
+
+            read = [record for message in messages
+                    for record in singer.BatchReader.from_message(message)]
+            self.assertEqual(records, read)
+
+    def test_no_empty_file_after_rotation(self):
+        with singer.BatchWriter('users', directory=self.directory.name,
+                                max_records=2) as writer:
+            writer.write_records([{'id': 1}, {'id': 2}])
+            self.assertIsNone(writer.file)
+            self.assertEqual(1, len(os.listdir(self.directory.name)))
+        self.assertEqual([2], [message.batch_size for message in self.batch_messages()])
+
+    def test_rotates_by_bytes(self):
+        with singer.BatchWriter('users', directory=self.directory.name,
+                                max_bytes=1) as writer:
+            writer.write_record({'id': 1})
+            writer.write_record({'id': 2})
+        self.assertEqual([1, 1], [message.batch_size for message in self.batch_messages()])
+
+    def test_no_records_no_batch(self):
+        with singer.BatchWriter('users', directory=self.directory.name):
+            pass
+        self.assertEqual([], self.batch_messages())
+        self.assertEqual([], os.listdir(self.directory.name))
+
+    def test_default_compression_is_gzip(self):
+        self.assertEqual('gzip', singer.BatchWriter('users').compression)
+
+
+class TestBatchReader(unittest.TestCase):
+    def test_messages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl.gz')
+            singer.set_message_writer(singer.MessageWriter(io.BytesIO()))
+            try:
+                with singer.BatchWriter('users', directory=directory, compression='gzip') as writer:
+                    writer.write_records([{'id': 1}, {'id': 2}])
+            finally:
+                singer.set_message_writer(None)
+
+            filepath, _ = writer.batches[0]
+            os.rename(filepath, path)
+            reader = singer.BatchReader(path, buffer_size=16)
+            self.assertEqual('gzip', reader.compression)
+            self.assertEqual([singer.RecordMessage(stream='users', record={'id': 1}),
+                              singer.RecordMessage(stream='users', record={'id': 2})],
+                             list(reader.messages()))
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(ValueError):
+            singer.BatchReader('/tmp/users.jsonl', compression='bzip2')
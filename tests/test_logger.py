@@ -0,0 +1,135 @@
+import io
+import logging
+import logging.handlers
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from singer import logger
+
+
+class TestGetLogger(unittest.TestCase):
+    def tearDown(self):
+        logger.reconfigure()
+
+    def test_configures_once(self):
+        logger.get_logger()
+        with mock.patch('logging.config.fileConfig') as file_config:
+            logger.get_logger()
+            logger.get_logger('other')
+        file_config.assert_not_called()
+
+    def test_reconfigures_when_env_var_changes(self):
+        logger.get_logger()
+        with tempfile.NamedTemporaryFile('w', suffix='.conf', delete=False) as conf:
+            conf.write('[loggers]\nkeys=root\n[handlers]\nkeys=\n[formatters]\nkeys=\n'
+                       '[logger_root]\nlevel=ERROR\nhandlers=\n')
+        try:
+            with mock.patch.dict(os.environ, {'LOGGING_CONF_FILE': conf.name}):
+                self.assertEqual(40, logger.get_logger().getEffectiveLevel())
+                logger.get_logger().root.setLevel(10)
+                self.assertEqual(10, logger.get_logger().getEffectiveLevel())
+            self.assertEqual(20, logger.get_logger().getEffectiveLevel())
+        finally:
+            os.remove(conf.name)
+
+    def test_reconfigure(self):
+        singer_logger = logger.get_logger()
+        singer_logger.root.setLevel(10)
+        logger.reconfigure()
+        self.assertEqual(20, singer_logger.getEffectiveLevel())
+
+
+class TestQueueLogging(unittest.TestCase):
+    def tearDown(self):
+        logger.set_queue_logging(None)
+
+    def test_handlers_run_in_listener_thread(self):
+        logger.set_queue_logging(True)
+        root = logging.getLogger()
+        self.assertEqual(1, len(root.handlers))
+        self.assertIsInstance(root.handlers[0], logging.handlers.QueueHandler)
+
+        stderr_handler, = logger._QUEUE_LISTENER.handlers
+        output = io.StringIO()
+        stderr_handler.setStream(output)
+        threads = []
+        stderr_handler.addFilter(lambda record: threads.append(threading.current_thread()) or True)
+
+        values = ['before']
+        logger.get_logger().warning('value: %s', values)
+        logger.get_logger().debug('not logged')
+        values[0] = 'after'
+        logger._stop_queue_listener()
+
+        self.assertIn("level=WARNING message=value: ['before']\n", output.getvalue())
+        self.assertNotIn('not logged', output.getvalue())
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_forked_child_logs_directly(self):
+        logger.set_queue_logging(True)
+        stderr_handler, = logger._QUEUE_LISTENER.handlers
+        with tempfile.TemporaryFile('w+') as output:
+            stderr_handler.setStream(output)
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    logger.get_logger().warning('from child')
+                    output.flush()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            output.seek(0)
+            self.assertIn('message=from child', output.read())
+
+    def test_env_var(self):
+        with mock.patch.dict(os.environ, {'LOGGING_USE_QUEUE': 'true'}):
+            logger.get_logger()
+            self.assertIsNotNone(logger._QUEUE_LISTENER)
+        logger.get_logger()
+        self.assertIsNone(logger._QUEUE_LISTENER)
+
+
+class TestLogSampler(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('singer.test_log_sampler')
+
+    def test_logs_first_occurrences_then_summaries(self):
+        sampler = logger.LogSampler(self.logger, first=2, interval=3600)
+        with self.assertLogs(self.logger, 'WARNING') as logs:
+            for i in range(5):
+                sampler.warning('bad value %s', i, path=('a',))
+            sampler.warning('bad value %s', 0, path=('b',))
+            sampler.flush()
+            sampler.flush()
+        self.assertEqual(['bad value 0', 'bad value 1', 'bad value 0',
+                          '3 more occurrences of "bad value %s" at a not logged, 5 in total'],
+                         [record.getMessage() for record in logs.records])
+
+    def test_summary_every_interval(self):
+        sampler = logger.LogSampler(self.logger, first=1, interval=0)
+        with self.assertLogs(self.logger, 'WARNING') as logs:
+            sampler.warning('bad value %s', 1)
+            sampler.warning('bad value %s', 2)
+        self.assertEqual(['bad value 1',
+                          '1 more occurrences of "bad value %s" at <root> not logged, 2 in total'],
+                         [record.getMessage() for record in logs.records])
+
+    def test_merges_counts_of_other_samplers(self):
+        worker = logger.LogSampler(self.logger, first=1, interval=3600)
+        sampler = logger.LogSampler(self.logger, first=1, interval=3600)
+        with self.assertLogs(self.logger, 'WARNING') as logs:
+            for i in range(4):
+                worker.warning('bad value %s', i, path=('a',))
+            sampler.merge(worker.pop_counts())
+            self.assertEqual({}, worker.pop_counts())
+            worker.warning('bad value %s', 4, path=('a',))
+            sampler.merge(worker.pop_counts())
+            worker.flush()
+            sampler.flush()
+        self.assertEqual(['bad value 0',
+                          '4 more occurrences of "bad value %s" at a not logged, 5 in total'],
+                         [record.getMessage() for record in logs.records])
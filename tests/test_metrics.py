@@ -3,6 +3,8 @@ from unittest.mock import patch
 import singer.metrics as metrics
 import time
 import copy
+import pickle
+import threading
 
 class DummyException(Exception):
     pass
@@ -36,6 +38,29 @@ class TestRecordCounter(unittest.TestCase):
              metrics.Point('counter', 'record_count', 5, {'endpoint': 'users'})],
             logged_points(log))
 
+    @patch('singer.metrics.TICKER_MIN_LOG_INTERVAL', 0.05)
+    @patch('singer.metrics.log')
+    def test_ticker_flags_due_counter(self, log):
+        with metrics.Counter('record_count', log_interval=0.05) as counter:
+            counter.increment()
+            self.assertFalse(counter._due)
+            deadline = time.time() + 5
+            while not counter._due and time.time() < deadline:
+                time.sleep(0.01)
+            counter.increment()
+            self.assertFalse(counter._due)
+        self.assertEqual([2, 0], [point.value for point in logged_points(log)])
+        self.assertTrue(counter._due)
+
+    @patch('singer.metrics.log')
+    def test_short_interval_checks_clock(self, log):
+        with metrics.Counter('record_count', log_interval=0) as counter:
+            counter.increment()
+            time.sleep(0.01)
+            counter.increment()
+        self.assertEqual(2, sum(point.value for point in logged_points(log)))
+        self.assertNotIn(counter, metrics._TICKER.counters)
+
 class TestHttpRequestTimer(unittest.TestCase):
 
     @patch('singer.metrics.log')
@@ -72,6 +97,94 @@ class TestHttpRequestTimer(unittest.TestCase):
             logged_points(log))
 
 
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_counts_from_threads(self):
+        registry = metrics.MetricsRegistry(stripes=4)
+        counter = registry.counter('record_count', {'endpoint': 'users'})
+
+        def work():
+            for _ in range(10000):
+                counter.increment()
+                registry.increment('record_count', {'endpoint': 'orders'})
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counts, timings = registry.pop_deltas()
+        self.assertEqual({('record_count', (('endpoint', 'users'),)): 40000,
+                          ('record_count', (('endpoint', 'orders'),)): 40000}, counts)
+        self.assertEqual({}, timings)
+        self.assertEqual(({}, {}), registry.pop_deltas())
+
+    def test_counts_while_popping(self):
+        registry = metrics.MetricsRegistry(stripes=2)
+        counter = registry.counter('record_count')
+        stop = threading.Event()
+        popped = []
+
+        def pop():
+            while not stop.is_set():
+                popped.append(registry.pop_deltas())
+
+        def work():
+            for _ in range(20000):
+                counter.increment()
+                registry.observe('job_duration', 0)
+
+        popper = threading.Thread(target=pop)
+        popper.start()
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        popper.join()
+        popped.append(registry.pop_deltas())
+
+        self.assertEqual(80000, sum(counts.get(('record_count', ()), 0)
+                                    for counts, _ in popped))
+        self.assertEqual(80000, sum(len(timings.get(('job_duration', ()), []))
+                                    for _, timings in popped))
+
+    @patch('singer.metrics.log')
+    def test_merge_and_emit(self, log):
+        worker = metrics.MetricsRegistry()
+        worker.increment('record_count', {'endpoint': 'users'}, 3)
+        with self.assertRaises(DummyException):
+            with worker.timer('http_request_duration', {'endpoint': 'users'}):
+                raise DummyException()
+
+        registry = metrics.MetricsRegistry()
+        registry.increment('record_count', {'endpoint': 'users'}, 2)
+        registry.merge(pickle.loads(pickle.dumps(worker.pop_deltas())))
+        registry.emit()
+        registry.emit()
+
+        counter, timer = logged_points(log)
+        self.assertEqual(metrics.Point('counter', 'record_count', 5, {'endpoint': 'users'}),
+                         counter)
+        self.assertEqual('timer', timer.metric_type)
+        self.assertEqual({'endpoint': 'users', 'status': 'failed'}, timer.tags)
+
+    @patch('singer.metrics.log')
+    def test_emits_on_exit(self, log):
+        with metrics.MetricsRegistry(log_interval=3600) as registry:
+            registry.increment('record_count')
+        self.assertEqual([metrics.Point('counter', 'record_count', 1, {})], logged_points(log))
+        self.assertIsNone(registry._emitter)
+
+    def test_forked_child_starts_empty(self):
+        registry = metrics.MetricsRegistry()
+        registry.increment('record_count')
+        registry._after_fork()
+        self.assertEqual(({}, {}), registry.pop_deltas())
+
+
 class TestParse(unittest.TestCase):
 
     def test_parse_with_everything(self):
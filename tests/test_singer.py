@@ -1,6 +1,17 @@
+import asyncio
+import copy
+import decimal
+import io
+import json
+import os
+import pickle
 import singer
+import tempfile
+import threading
+import time
 import orjson
 import unittest
+from unittest import mock
 import dateutil
 
 
@@ -46,6 +57,18 @@ class TestSinger(unittest.TestCase):
         expected = '1970-01-02T00:00:00.000000Z'
         self.assertEqual(message.asdict()['time_extracted'], expected)
 
+    def test_format_record_message_with_time_extracted(self):
+        time_extracted = dateutil.parser.parse('1970-01-02T02:00:00.000+02:00')
+        for version in (None, 2):
+            message = singer.RecordMessage(record={'name': 'foo'}, stream='users',
+                                           version=version, time_extracted=time_extracted)
+            self.assertEqual(orjson.dumps(message.asdict()), singer.format_message(message))
+            self.assertEqual('1970-01-02T00:00:00.000000Z', message.asdict()['time_extracted'])
+
+    def test_format_record_message_versions_of_equal_value(self):
+        for version in (1, 1.0, True, 1):
+            message = singer.RecordMessage(record={}, stream='users', version=version)
+            self.assertEqual(orjson.dumps(message.asdict()), singer.format_message(message))
 
     def test_parse_message_record_missing_record(self):
         with self.assertRaises(Exception):
@@ -139,6 +162,467 @@ class TestSinger(unittest.TestCase):
         singer.write_batch('users', '/tmp/users0001.jsonl')
 
 
+def write_records_from_threads(thread_count=4, record_count=5000):
+    def write(thread):
+        for i in range(record_count):
+            singer.write_record('users', {'thread': thread, 'id': i})
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+EXPECTED_THREADED_LINES = sorted(
+    orjson.dumps({'type': 'RECORD', 'stream': 'users', 'record': {'thread': thread, 'id': i}})
+    for thread in range(4) for i in range(5000))
+
+
+class TestMessageWriter(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.BytesIO()
+
+    def tearDown(self):
+        singer.set_message_writer(None)
+
+    def test_buffers_until_max_bytes(self):
+        writer = singer.MessageWriter(self.stream, max_bytes=100)
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+        self.assertEqual(b'', self.stream.getvalue())
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 2, 'name': 'x' * 100}))
+        self.assertEqual(2, self.stream.getvalue().count(b'\n'))
+
+    def test_flushes_on_max_messages(self):
+        writer = singer.MessageWriter(self.stream, max_messages=2)
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+        self.assertEqual(b'', self.stream.getvalue())
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 2}))
+        self.assertEqual(2, self.stream.getvalue().count(b'\n'))
+
+    def test_flushes_on_max_interval(self):
+        writer = singer.MessageWriter(self.stream, max_interval=0)
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+        self.assertEqual(1, self.stream.getvalue().count(b'\n'))
+
+    def test_flushes_on_state(self):
+        writer = singer.MessageWriter(self.stream)
+        singer.set_message_writer(writer)
+        singer.write_record('users', {'id': 1})
+        self.assertEqual(b'', self.stream.getvalue())
+        singer.write_state({'users': 1})
+        self.assertEqual(
+            b'{"type":"RECORD","stream":"users","record":{"id":1}}\n'
+            b'{"type":"STATE","value":{"users":1}}\n',
+            self.stream.getvalue())
+
+    def test_flushes_on_exit(self):
+        with singer.MessageWriter(self.stream) as writer:
+            writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+        self.assertEqual(b'{"type":"RECORD","stream":"users","record":{"id":1}}\n',
+                         self.stream.getvalue())
+
+    def test_write_records_matches_format_message(self):
+        records = [{'id': 1, 'name': 'chris'}, {'id': 2, 'amount': decimal.Decimal('1.5')}, {'id': 3}]
+        time_extracted = dateutil.parser.parse('1970-01-02T00:00:00.000Z')
+        singer.set_message_writer(singer.MessageWriter(self.stream))
+        singer.write_records('users', records, stream_alias='people',
+                             time_extracted=time_extracted, chunk_size=2)
+        singer.set_message_writer(None)
+        expected = b''.join(
+            singer.format_message(singer.RecordMessage(stream='people',
+                                                       record=record,
+                                                       time_extracted=time_extracted),
+                                  option=orjson.OPT_APPEND_NEWLINE)
+            for record in records)
+        self.assertEqual(expected, self.stream.getvalue())
+
+    def test_write_records_writes_once_per_chunk(self):
+        writer = singer.MessageWriter(self.stream, max_messages=2)
+        singer.set_message_writer(writer)
+        singer.write_records('users', iter([{'id': 1}, {'id': 2}, {'id': 3}]), chunk_size=2)
+        self.assertEqual(2, self.stream.getvalue().count(b'\n'))
+        self.assertEqual(1, writer.message_count)
+
+    def test_replacing_writer_flushes_previous(self):
+        singer.set_message_writer(singer.MessageWriter(self.stream))
+        singer.write_record('users', {'id': 1})
+        previous = singer.set_message_writer(None)
+        self.assertIsInstance(previous, singer.MessageWriter)
+        self.assertIsNone(singer.get_message_writer())
+        self.assertEqual(1, self.stream.getvalue().count(b'\n'))
+
+    def test_writes_from_threads(self):
+        with tempfile.TemporaryFile(buffering=0) as output:
+            singer.set_message_writer(singer.MessageWriter(output, max_messages=50))
+            write_records_from_threads()
+            singer.set_message_writer(None)
+            output.seek(0)
+            self.assertEqual(EXPECTED_THREADED_LINES, sorted(output.read().splitlines()))
+
+
+class TestBackgroundMessageWriter(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.BytesIO()
+
+    def tearDown(self):
+        singer.set_message_writer(None)
+
+    def test_writes_in_background_and_drains_on_state(self):
+        writer = singer.BackgroundMessageWriter(self.stream, max_messages=1)
+        singer.set_message_writer(writer)
+        singer.write_records('users', [{'id': i} for i in range(100)])
+        self.assertIsNotNone(writer.thread)
+        singer.write_state({'users': 100})
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(101, len(lines))
+        self.assertEqual(b'{"type":"STATE","value":{"users":100}}', lines[-1])
+        writer.close()
+        self.assertIsNone(writer.thread)
+
+    def test_flushes_on_exit(self):
+        with singer.BackgroundMessageWriter(self.stream, max_messages=1) as writer:
+            writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+            writer.write_message(singer.RecordMessage(stream='users', record={'id': 2}))
+        self.assertEqual(2, self.stream.getvalue().count(b'\n'))
+
+    def test_flushes_idle_buffer_after_max_interval(self):
+        with singer.BackgroundMessageWriter(self.stream, max_interval=0.05) as writer:
+            writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+            deadline = time.monotonic() + 5
+            while not self.stream.getvalue() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(b'{"type":"RECORD","stream":"users","record":{"id":1}}\n',
+                             self.stream.getvalue())
+            self.assertEqual(b'', writer.buffer)
+
+    def test_raises_write_errors(self):
+        class BrokenStream(io.BytesIO):
+            def write(self, data):
+                raise OSError('broken pipe')
+
+        writer = singer.BackgroundMessageWriter(BrokenStream(), max_messages=1)
+        writer.write_message(singer.RecordMessage(stream='users', record={'id': 1}))
+        with self.assertRaises(Exception) as context:
+            writer.flush()
+        self.assertIsInstance(context.exception.__cause__, OSError)
+        with self.assertRaises(Exception):
+            writer.write_message(singer.RecordMessage(stream='users', record={'id': 2}))
+        with self.assertRaises(Exception):
+            writer.close()
+
+    def test_writes_from_threads(self):
+        stream = io.BytesIO()
+        with singer.BackgroundMessageWriter(stream, max_messages=50) as writer:
+            singer.set_message_writer(writer)
+            write_records_from_threads()
+            singer.set_message_writer(None)
+        self.assertEqual(EXPECTED_THREADED_LINES, sorted(stream.getvalue().splitlines()))
+
+
+class TestAsyncMessageWriter(unittest.TestCase):
+    async def write_messages(self, writer):
+        async with writer:
+            await writer.write_schema('users', {}, 'id')
+            await writer.write_records('users', [{'id': 1}, {'id': 2}])
+            await writer.write_state({'users': 2})
+            self.assertEqual(b'', writer.buffer)
+            await writer.write_record('users', {'id': 3})
+        return writer
+
+    def expected(self):
+        return (b'{"type":"SCHEMA","stream":"users","schema":{},"key_properties":["id"]}\n'
+                b'{"type":"RECORD","stream":"users","record":{"id":1}}\n'
+                b'{"type":"RECORD","stream":"users","record":{"id":2}}\n'
+                b'{"type":"STATE","value":{"users":2}}\n'
+                b'{"type":"RECORD","stream":"users","record":{"id":3}}\n')
+
+    def test_writes_to_pipe(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, 'rb') as read_pipe, os.fdopen(write_fd, 'wb') as write_pipe:
+            writer = asyncio.run(self.write_messages(singer.AsyncMessageWriter(write_pipe)))
+            self.assertIsNone(writer.transport)
+            self.assertTrue(os.get_blocking(write_fd))
+            write_pipe.close()
+            self.assertEqual(self.expected(), read_pipe.read())
+
+    def test_falls_back_to_synchronous_writes(self):
+        stream = io.BytesIO()
+        asyncio.run(self.write_messages(singer.AsyncMessageWriter(stream)))
+        self.assertEqual(self.expected(), stream.getvalue())
+
+    def test_concurrent_writers_with_slow_reader(self):
+        read_fd, write_fd = os.pipe()
+        chunks = []
+
+        def read_slowly():
+            with os.fdopen(read_fd, 'rb', buffering=0) as read_pipe:
+                while True:
+                    time.sleep(0.005)
+                    chunk = read_pipe.read(8192)
+                    if not chunk:
+                        return
+                    chunks.append(chunk)
+
+        async def write(writer, task):
+            for i in range(2000):
+                await writer.write_record('users', {'task': task, 'id': i, 'padding': 'x' * 100})
+
+        async def write_concurrently(writer):
+            async with writer:
+                await asyncio.wait_for(asyncio.gather(write(writer, 0), write(writer, 1)), 60)
+
+        reader = threading.Thread(target=read_slowly)
+        reader.start()
+        with os.fdopen(write_fd, 'wb') as write_pipe:
+            writer = singer.AsyncMessageWriter(write_pipe, max_bytes=4096)
+            asyncio.run(write_concurrently(writer))
+        reader.join()
+        self.assertEqual(4000, b''.join(chunks).count(b'\n'))
+
+    def test_concurrent_flushes_connect_once(self):
+        read_fd, write_fd = os.pipe()
+
+        async def flush_twice(writer):
+            async with writer:
+                await writer.write(b'{"type":"STATE","value":{}}\n')
+                with mock.patch.object(writer, '_connect', wraps=writer._connect) as connect:
+                    await asyncio.gather(writer.flush(), writer.flush())
+                self.assertEqual(1, connect.call_count)
+
+        with os.fdopen(read_fd, 'rb') as read_pipe, os.fdopen(write_fd, 'wb') as write_pipe:
+            asyncio.run(flush_twice(singer.AsyncMessageWriter(write_pipe)))
+            write_pipe.close()
+            self.assertEqual(b'{"type":"STATE","value":{}}\n', read_pipe.read())
+
+    def test_resuming_wakes_all_drains(self):
+        async def drain_twice():
+            protocol = singer.messages._PipeProtocol(asyncio.get_running_loop())
+            protocol.pause_writing()
+            drains = asyncio.gather(protocol.drain(), protocol.drain())
+            await asyncio.sleep(0)
+            protocol.resume_writing()
+            await asyncio.wait_for(drains, 5)
+
+        asyncio.run(drain_twice())
+
+    def test_closed_pipe(self):
+        read_fd, write_fd = os.pipe()
+        os.close(read_fd)
+
+        async def write(writer):
+            async with writer:
+                for i in range(3):
+                    await writer.write_record('users', {'id': i})
+                    await writer.flush()
+
+        with os.fdopen(write_fd, 'wb') as write_pipe:
+            with self.assertRaisesRegex(Exception, 'The pipe was closed'):
+                asyncio.run(write(singer.AsyncMessageWriter(write_pipe)))
+            self.assertTrue(os.get_blocking(write_fd))
+
+
+class TestMessageReader(unittest.TestCase):
+    messages = [
+        singer.SchemaMessage(stream='users', schema={'type': 'object'}, key_properties=['id']),
+        singer.RecordMessage(stream='users', record={'id': 1, 'name': 'x' * 50}),
+        singer.RecordMessage(stream='users', record={'id': 2, 'name': 'żółw'}),
+        singer.StateMessage(value={'users': 2}),
+    ]
+
+    def serialized(self):
+        return b''.join(singer.format_message(message, option=orjson.OPT_APPEND_NEWLINE)
+                        for message in self.messages)
+
+    def test_reads_messages(self):
+        reader = singer.MessageReader(io.BufferedReader(io.BytesIO(self.serialized()), 16))
+        self.assertEqual(self.messages, list(reader))
+
+    def test_last_line_without_newline_and_empty_lines(self):
+        data = b'\n' + self.serialized().replace(b'}\n{', b'}\n\n{').rstrip(b'\n')
+        reader = singer.MessageReader(io.BytesIO(data))
+        self.assertEqual(self.messages, list(reader))
+
+    def test_lines(self):
+        reader = singer.MessageReader(io.BytesIO(b'{"a":1}\n\n{"b":2}'))
+        self.assertEqual([b'{"a":1}\n', b'{"b":2}'], list(reader.lines()))
+
+
+class TestLazyRecordMessage(unittest.TestCase):
+    time_extracted = dateutil.parser.parse('1970-01-02T00:00:00.000Z')
+
+    def test_parse_lazy_record(self):
+        messages = [
+            singer.RecordMessage(stream='users', record={'id': 1}),
+            singer.RecordMessage(stream='us"ers', record={'id': 1, 'version': 2}, version=3),
+            singer.RecordMessage(stream='users', record={'a': '\'"record":{', 'version': 2},
+                                 time_extracted=self.time_extracted),
+            singer.RecordMessage(stream='users', record={'time_extracted': 'x'}, version=-1,
+                                 time_extracted=self.time_extracted),
+        ]
+        for message in messages:
+            line = singer.format_message(message, option=orjson.OPT_APPEND_NEWLINE)
+            lazy = singer.parse_message(memoryview(line), lazy=True)
+            self.assertIsInstance(lazy, singer.LazyRecordMessage)
+            self.assertFalse(lazy.decoded)
+            self.assertEqual(message.stream, lazy.stream)
+            self.assertEqual(message.version, lazy.version)
+            self.assertEqual(message.time_extracted, lazy.time_extracted)
+            self.assertEqual(line, singer.format_message(lazy, option=orjson.OPT_APPEND_NEWLINE))
+            self.assertEqual(message.record, lazy.record)
+            self.assertTrue(lazy.decoded)
+            self.assertEqual(message, lazy)
+
+    def test_lazy_falls_back_to_full_parse(self):
+        for msg in ['{"type": "RECORD", "stream": "users", "record": {"name": "foo"}}',
+                    '{"type":"RECORD","stream":"users","record":1}',
+                    '{"type":"RECORD","stream":"users","record":{"a":1},"meta":{"b":2}}',
+                    '{"type":"RECORD","stream":"users","record":{"a":{"b":"}"}},"meta":{"b":2}}',
+                    '{"type":"STATE","value":{"seq":1}}']:
+            message = singer.parse_message(msg, lazy=True)
+            self.assertNotIsInstance(message, singer.LazyRecordMessage)
+            self.assertEqual(singer.parse_message(msg), message)
+
+    def test_lazy_nested_records(self):
+        for record in [{'a': {'b': [1, {'c': 2}]}, 'd': 'x"}'}, {'a': [{}], 'b': {}}, {'a': '}{'},
+                       {'a': '\\', 'b': {'c': '\\"'}}]:
+            msg = singer.format_message(singer.RecordMessage(stream='users', record=record))
+            message = singer.parse_message(msg, lazy=True)
+            self.assertIsInstance(message, singer.LazyRecordMessage)
+            self.assertEqual(record, message.record)
+
+    def test_format_undecoded_record_with_new_stream(self):
+        lazy = singer.parse_message(b'{"type":"RECORD","stream":"users","record":{"id":1}}', lazy=True)
+        lazy.stream = 'people'
+        self.assertEqual(b'{"type":"RECORD","stream":"people","record":{"id":1}}',
+                         singer.format_message(lazy))
+        self.assertFalse(lazy.decoded)
+
+    def test_format_decoded_record(self):
+        lazy = singer.parse_message(b'{"type":"RECORD","stream":"users","record":{"id":1}}', lazy=True)
+        lazy.record['id'] = 2
+        self.assertEqual(b'{"type":"RECORD","stream":"users","record":{"id":2}}',
+                         singer.format_message(lazy))
+
+    def test_message_reader_lazy(self):
+        data = (b'{"type":"RECORD","stream":"users","record":{"id":1}}\n'
+                b'{"type":"STATE","value":{"seq":1}}\n')
+        messages = list(singer.MessageReader(io.BytesIO(data), lazy=True))
+        self.assertIsInstance(messages[0], singer.LazyRecordMessage)
+        self.assertEqual([singer.RecordMessage(stream='users', record={'id': 1}),
+                          singer.StateMessage(value={'seq': 1})],
+                         messages)
+
+
+class TestMessageSource(unittest.TestCase):
+    def test_reuses_source_of_clean_messages(self):
+        lines = [b'{"type": "RECORD", "stream": "users", "record": {"id": 1.0}}',
+                 b'{"type": "SCHEMA", "stream": "users", "schema": {}, "key_properties": []}',
+                 b'{"type": "STATE", "value": {"seq": 1}}',
+                 b'{"type": "ACTIVATE_VERSION", "stream": "users", "version": 1}',
+                 b'{"type": "BATCH", "stream": "users", "filepath": "/tmp/a", "format": "jsonl"}']
+        for line in lines:
+            for lazy in (False, True):
+                message = singer.parse_message(line + b'\n', lazy=lazy, keep_source=True)
+                self.assertFalse(message.dirty)
+                self.assertEqual(line, singer.format_message(message))
+                self.assertEqual(line + b'\n',
+                                 singer.format_message(message, option=orjson.OPT_APPEND_NEWLINE))
+                self.assertNotEqual(line, singer.format_message(message, option=orjson.OPT_SORT_KEYS))
+
+    def test_assignment_makes_message_dirty(self):
+        line = '{"type": "RECORD", "stream": "users", "record": {"id": 1}}'
+        message = singer.parse_message(line, keep_source=True)
+        message.stream = 'people'
+        self.assertTrue(message.dirty)
+        self.assertEqual(b'{"type":"RECORD","stream":"people","record":{"id":1}}',
+                         singer.format_message(message))
+
+        lazy = singer.parse_message(line, lazy=True, keep_source=True)
+        lazy.record = {'id': 2}
+        self.assertTrue(lazy.dirty)
+        self.assertEqual(b'{"type":"RECORD","stream":"users","record":{"id":2}}',
+                         singer.format_message(lazy))
+
+    def test_decoding_makes_lazy_message_dirty(self):
+        line = b'{"type":"RECORD","stream":"users","record":{"id":1}}'
+        lazy = singer.parse_message(line, lazy=True, keep_source=True)
+        self.assertIsInstance(lazy, singer.LazyRecordMessage)
+        self.assertFalse(lazy.dirty)
+        lazy.record['id'] = 2
+        self.assertTrue(lazy.dirty)
+        self.assertEqual(b'{"type":"RECORD","stream":"users","record":{"id":2}}',
+                         singer.format_message(lazy))
+
+    def test_mark_dirty(self):
+        message = singer.parse_message('{"type": "STATE", "value": {"seq": 1}}', keep_source=True)
+        message.value['seq'] = 2
+        message.mark_dirty()
+        self.assertIsNone(message.source)
+        self.assertEqual(b'{"type":"STATE","value":{"seq":2}}', singer.format_message(message))
+
+    def test_messages_without_source_are_dirty(self):
+        self.assertTrue(singer.StateMessage(value={}).dirty)
+
+    def test_message_reader_keep_source(self):
+        data = b'{"type": "STATE", "value": {"seq": 1}}\n'
+        message, = singer.MessageReader(io.BytesIO(data), keep_source=True)
+        self.assertEqual(data, singer.format_message(message, option=orjson.OPT_APPEND_NEWLINE))
+
+
+class TestMessageSlots(unittest.TestCase):
+    def test_messages_have_no_dict(self):
+        messages = [singer.RecordMessage(stream='users', record={'id': 1}),
+                    singer.LazyRecordMessage(stream='users', raw_record=b'{"id":1}'),
+                    singer.SchemaMessage(stream='users', schema={}, key_properties=[]),
+                    singer.StateMessage(value={}),
+                    singer.ActivateVersionMessage(stream='users', version=1),
+                    singer.BatchMessage(stream='users', filepath='/tmp/a')]
+        for message in messages:
+            self.assertFalse(hasattr(message, '__dict__'))
+            self.assertIsNone(message.source)
+            with self.assertRaises(AttributeError):
+                message.unknown = 1
+
+    def test_copy_and_pickle(self):
+        time_extracted = dateutil.parser.parse('1970-01-02T00:00:00.000Z')
+        decoded = singer.LazyRecordMessage(stream='users', raw_record=b'{"id":1}')
+        decoded.record['id'] = 2
+        messages = [singer.RecordMessage(stream='users', record={'id': 1}, version=1,
+                                         time_extracted=time_extracted),
+                    singer.parse_message(b'{"type":"RECORD","stream":"users","record":{"id":1}}',
+                                         lazy=True, keep_source=True),
+                    decoded,
+                    singer.SchemaMessage(stream='users', schema={}, key_properties=[]),
+                    singer.StateMessage(value={'users': 1}),
+                    singer.ActivateVersionMessage(stream='users', version=1),
+                    singer.BatchMessage(stream='users', filepath='/tmp/a',
+                                        time_extracted=time_extracted)]
+        for message in messages:
+            expected = singer.format_message(message)
+            for duplicate in (copy.copy, copy.deepcopy, lambda m: pickle.loads(pickle.dumps(m))):
+                result = duplicate(message)
+                self.assertIs(type(message), type(result))
+                self.assertEqual(expected, singer.format_message(result))
+                self.assertEqual(message, result)
+
+        message = singer.LazyRecordMessage(stream='users', raw_record=b'{"id":1}')
+        lazy = pickle.loads(pickle.dumps(message))
+        self.assertFalse(message.decoded)
+        self.assertFalse(lazy.decoded)
+        self.assertEqual({'id': 1}, lazy.record)
+
+    def test_subclass_without_slots(self):
+        class CustomMessage(singer.Message):
+            def asdict(self):
+                return {'type': 'CUSTOM'}
+
+        message = CustomMessage()
+        self.assertIsNone(message.source)
+        self.assertTrue(message.dirty)
+        self.assertEqual(b'{"type":"CUSTOM"}', singer.format_message(message))
+
+
 class TestParsingNumbers(unittest.TestCase):
     def create_record(self, value):
         raw = '{"type": "RECORD", "stream": "test", "record": {"value": ' + value + '}}'
@@ -192,6 +676,30 @@ class TestParsingNumbers(unittest.TestCase):
             value = self.create_record(value_str)
             self.assertEqual(float(value_str), value)
 
+    def test_parse_exact_numbers(self):
+        raw = ('{"type": "RECORD", "stream": "test", "record": {"value": '
+               '[-9999999999999999.9999999999999999999999, 1.50, 1E-400, 0]}}')
+        expected = [decimal.Decimal('-9999999999999999.9999999999999999999999'),
+                    decimal.Decimal('1.50'), decimal.Decimal('1E-400'), 0]
+        message = singer.parse_message(raw, exact_numbers=True)
+        self.assertEqual(expected, message.record['value'])
+
+        formatted = singer.format_message(message, decimal_mode=singer.DECIMAL_EXACT)
+        lazy = singer.parse_message(formatted, lazy=True, exact_numbers=True)
+        self.assertIsInstance(lazy, singer.LazyRecordMessage)
+        self.assertFalse(lazy.decoded)
+        self.assertEqual(expected, lazy.record['value'])
+
+    def test_parse_exact_absurdly_large_int(self):
+        raw = '{"type": "RECORD", "stream": "test", "record": {"value": ' + '9' * 1024 + '}}'
+        self.assertEqual(int('9' * 1024),
+                         singer.parse_message(raw, exact_numbers=True).record['value'])
+
+    def test_message_reader_exact_numbers(self):
+        data = b'{"type": "STATE", "value": {"seq": 0.10}}\n'
+        message, = singer.MessageReader(io.BytesIO(data), exact_numbers=True)
+        self.assertEqual(decimal.Decimal('0.10'), message.value['seq'])
+
     def test_format_message(self):
         record_message = singer.RecordMessage(
             record={'name': 'foo'},
@@ -207,5 +715,46 @@ class TestParsingNumbers(unittest.TestCase):
                          singer.format_message(record_message, option=orjson.OPT_APPEND_NEWLINE))
 
 
+class TestDecimalMode(unittest.TestCase):
+    def setUp(self):
+        self.message = singer.RecordMessage(stream='test', record={
+            'exact': decimal.Decimal('9999999999999999.9999999999999999999999'),
+            'integral': decimal.Decimal('12'),
+            'exponent': decimal.Decimal('1E+2'),
+            'nan': decimal.Decimal('NaN'),
+            'list': [decimal.Decimal('0.10')],
+            'marker': '\x00Decimal\x001',
+        })
+
+    def tearDown(self):
+        singer.set_decimal_mode(singer.DECIMAL_AS_FLOAT)
+
+    def test_decimals_as_float(self):
+        self.assertEqual(
+            b'{"exact":9999999999999999,"integral":12,"exponent":100,"nan":null,"list":[0.1],'
+            b'"marker":"\\u0000Decimal\\u00001"}',
+            orjson.dumps(orjson.loads(singer.format_message(self.message))['record']))
+
+    def test_exact_decimals(self):
+        expected = (b'{"type":"RECORD","stream":"test","record":'
+                    b'{"exact":9999999999999999.9999999999999999999999,"integral":12,'
+                    b'"exponent":1E+2,"nan":null,"list":[0.10],'
+                    b'"marker":"\\u0000Decimal\\u00001"}}')
+        self.assertEqual(expected,
+                         singer.format_message(self.message, decimal_mode=singer.DECIMAL_EXACT))
+
+        self.assertEqual(singer.DECIMAL_AS_FLOAT, singer.set_decimal_mode(singer.DECIMAL_EXACT))
+        self.assertEqual(expected, singer.format_message(self.message))
+
+        indented = json.loads(singer.format_message(self.message, option=orjson.OPT_INDENT_2),
+                              parse_float=decimal.Decimal)
+        for key in ('exact', 'integral', 'exponent', 'list', 'marker'):
+            self.assertEqual(self.message.record[key], indented['record'][key])
+
+    def test_unknown_decimal_mode(self):
+        with self.assertRaises(ValueError):
+            singer.set_decimal_mode('string')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,9 @@
+import copy
+import multiprocessing
 import unittest
+from unittest import mock
 from singer import transform
+from singer.logger import LogSampler
 from singer.transform import *
 
 
@@ -67,12 +71,42 @@ class TestTransform(unittest.TestCase):
         trans.integer_datetime_fmt = UNIX_SECONDS_INTEGER_DATETIME_PARSING
         self.assertIsNone(trans._transform_datetime('cat'))
 
+    def test_datetime_cache(self):
+        schema = {'type': 'string', 'format': 'date-time'}
+        trans = Transformer(datetime_cache_size=2)
+        for value in ['2017-01-01', '2017-01-01', '2017-01-02', '2017-01-01', '2017-01-03']:
+            self.assertEqual(value + 'T00:00:00.000000Z', trans.transform(value, schema))
+        self.assertEqual(2, trans.datetime_cache_hits)
+        self.assertEqual(3, trans.datetime_cache_misses)
+        # least recently used value was evicted
+        self.assertEqual(['2017-01-01', '2017-01-03'], list(trans.datetime_cache))
+
+    def test_datetime_cache_integer_formats(self):
+        trans = Transformer(UNIX_SECONDS_INTEGER_DATETIME_PARSING, datetime_cache_size=10)
+        self.assertEqual('1970-01-02T00:00:00.000000Z', trans._transform_datetime(86400))
+        self.assertEqual('1970-01-02T00:00:00.000000Z', trans._transform_datetime(86400))
+        self.assertEqual(1, trans.datetime_cache_hits)
+        trans.integer_datetime_fmt = UNIX_MILLISECONDS_INTEGER_DATETIME_PARSING
+        self.assertEqual('1970-01-01T00:01:26.400000Z', trans._transform_datetime(86400))
+        self.assertIsNone(trans._transform_datetime('cat'))
+        self.assertNotIn('cat', trans.datetime_cache)
+
     def test_datetime_string_with_timezone(self):
         schema = {'type': 'string', 'format': 'date-time'}
         string_datetime = '2017-03-18T07:00:05-0700'
         transformed_string_datetime = '2017-03-18T14:00:05.000000Z'
         self.assertEqual(transformed_string_datetime, transform(string_datetime, schema))
 
+    def test_datetime_rfc3339_fast_path(self):
+        schema = {'type': 'string', 'format': 'date-time'}
+        self.assertEqual('2017-03-18T14:00:05.000000Z', transform('2017-03-18T07:00:05-07:00', schema))
+        self.assertEqual('2017-01-01T00:00:00.123456Z', transform('2017-01-01 00:00:00.1234567z', schema))
+        self.assertEqual('2017-01-01T00:00:00.000000Z', transform('2017-01-01T00:00:00+00:00', schema))
+        self.assertEqual('2017-01-01T00:00:00.000000Z', transform('2017-01-01T00:00:00.000000Z', schema))
+        self.assertEqual('2017-01-01T00:00:00.000000Z', transform('Jan 1 2017', schema))
+        with self.assertRaises(SchemaMismatch):
+            transform('2017-13-01T00:00:00.000000Z', schema)
+
     def test_datetime_fractional_seconds_transform(self):
         schema = {'type': 'string', 'format': 'date-time'}
         string_datetime = '2017-01-01T00:00:00.123000Z'
@@ -222,6 +256,21 @@ class TestTransform(unittest.TestCase):
         ]
         self.assertListEqual(expected, sorted(e.path for e in trans.errors))
 
+    def test_datetime_warnings_sampled_per_path(self):
+        schema = {'type': 'object',
+                  'properties': {'dates': {'type': 'array',
+                                           'items': {'type': 'string', 'format': 'date-time'}},
+                                 'other': {'type': 'string', 'format': 'date-time'}}}
+        data = {'dates': ['not a datetime'] * 20, 'other': 'not a datetime'}
+        with mock.patch('singer.transform.DATETIME_WARNINGS', LogSampler(LOGGER, first=2)):
+            with self.assertLogs(LOGGER, 'WARNING') as logs:
+                with Transformer() as trans:
+                    trans.transform_recur(data, schema, [])
+        messages = [record.getMessage() for record in logs.records]
+        self.assertEqual(4, len(messages))
+        self.assertEqual('18 more occurrences of "%s, (%s)" at dates not logged, 20 in total',
+                         messages[-1])
+
     def test_unexpected_object_properties(self):
         schema = {'type': 'object',
                   'properties': {'good_property': {'type': 'string'}}}
@@ -252,6 +301,192 @@ class TestTransform(unittest.TestCase):
         empty_data = {'addrs': {}}
         self.assertDictEqual(empty_data, transform(empty_data, schema))
 
+class TestCompiledSchema(unittest.TestCase):
+    def assert_same_as_transformer(self, data, schema, **kwargs):
+        expected_trans = Transformer(**kwargs)
+        expected = expected_trans.transform_recur(copy.deepcopy(data), copy.deepcopy(schema), [])
+        trans = Transformer(**kwargs)
+        compiled = compile_schema(copy.deepcopy(schema))
+        got = compiled.converter(trans, copy.deepcopy(data), [])
+        self.assertEqual(expected, got)
+        self.assertEqual(expected_trans.removed, trans.removed)
+        self.assertEqual(sorted(e.path for e in expected_trans.errors),
+                         sorted(e.path for e in trans.errors))
+
+    def test_matches_transformer(self):
+        nested = {'type': 'object',
+                  'properties': {'id': {'type': ['null', 'integer']},
+                                 'name': {'type': 'string'},
+                                 'ok': {'type': 'boolean'},
+                                 'cost': {'type': ['number', 'null']},
+                                 'created': {'type': ['null', 'string'], 'format': 'date-time'},
+                                 'tags': {'type': 'array', 'items': {'type': 'string'}},
+                                 'any': {},
+                                 'addr': {'type': ['null', 'object'],
+                                          'properties': {'city': {'type': 'string'},
+                                                         'zip': {'type': 'integer'}}},
+                                 'either': {'anyOf': [{'type': 'integer'}, {'type': 'string'}]}},
+                  'patternProperties': {'^custom_': {'type': 'integer'}}}
+        cases = [
+            {'id': '1,234', 'name': 5, 'ok': 'false', 'cost': '1.5', 'created': '2017-01-01',
+             'tags': [1, 'a'], 'any': {'x': 1}, 'addr': {'city': 'x', 'zip': '123'},
+             'either': 'abc', 'custom_1': '7', 'unknown': 1},
+            {'id': None, 'name': None, 'created': 'not a date', 'addr': None, 'custom_2': 'x'},
+            {'id': 'x', 'tags': 'not a list', 'addr': {'zip': 'x', 'extra': 1}},
+            'not an object',
+        ]
+        for data in cases:
+            self.assert_same_as_transformer(data, nested)
+
+    def test_matches_transformer_with_options(self):
+        schema = {'type': 'object',
+                  'properties': {'ts': {'type': 'string', 'format': 'date-time'},
+                                 'n': {'type': 'integer'}}}
+        data = {'ts': 86400, 'n': '5'}
+        self.assert_same_as_transformer(data, schema,
+                                        integer_datetime_fmt=UNIX_SECONDS_INTEGER_DATETIME_PARSING)
+        self.assert_same_as_transformer(data, schema,
+                                        pre_hook=lambda data, typ, schema: data)
+
+    def test_transform_with_compiled_schema(self):
+        schema = {'type': 'object',
+                  'properties': {'amount': {'type': 'integer'}}}
+        compiled = compile_schema(schema)
+        self.assertEqual({'amount': 1}, Transformer().transform({'amount': '1'}, compiled))
+        with self.assertRaises(SchemaMismatch):
+            Transformer().transform({'amount': 'x'}, compiled)
+
+    def test_compiled_transformer(self):
+        schema = {'type': 'object',
+                  'properties': {'name': {'type': 'string'},
+                                 'amount': {'type': 'integer'}}}
+        metadata = {('properties', 'name'): {'selected': False}}
+        with CompiledTransformer(schema) as trans:
+            self.assertEqual({'amount': 1}, trans.transform({'name': 'a', 'amount': '1'}, metadata))
+            self.assertEqual({'amount': 2}, trans.transform({'amount': 2, 'extra': 1}))
+        self.assertEqual({'name'}, trans.filtered)
+        self.assertEqual({'extra'}, trans.removed)
+
+class TestTransformMany(unittest.TestCase):
+    schema = {'type': 'object',
+              'properties': {'id': {'type': 'integer'},
+                             'name': {'type': ['null', 'string']}}}
+
+    def test_transform_many(self):
+        records = [{'id': '1', 'name': 'a'}, {'id': 'x'}, {'id': 3, 'name': None, 'extra': 1}]
+        metadata = {('properties', 'name'): {'selected': False}}
+        with Transformer() as trans:
+            results = trans.transform_many(records, self.schema, metadata=metadata)
+        self.assertEqual([{'id': 1}, None, {'id': 3}], [result.record for result in results])
+        self.assertIsNone(results[0].errors)
+        self.assertEqual([['id'], []], [e.path for e in results[1].errors])
+        self.assertIsNone(results[2].errors)
+        self.assertEqual({'name'}, trans.filtered)
+        self.assertEqual({'extra'}, trans.removed)
+        self.assertEqual(2, len(trans.errors))
+
+    def test_compiled_transformer_transform_many(self):
+        trans = CompiledTransformer(self.schema)
+        results = trans.transform_many([{'id': '1'}, {'id': 2, 'name': 3}])
+        self.assertEqual([TransformResult({'id': 1}, None), TransformResult({'id': 2, 'name': '3'}, None)],
+                         results)
+
+
+class TestTransformColumnar(unittest.TestCase):
+    schema = {'type': ['null', 'object'],
+              'properties': {'id': {'type': 'integer'},
+                             'name': {'type': ['null', 'string']},
+                             'cost': {'type': ['null', 'number']},
+                             'active': {'type': ['null', 'boolean']},
+                             'created': {'type': ['null', 'string'], 'format': 'date-time'},
+                             'tags': {'type': 'array', 'items': {'type': 'string'}},
+                             'secret': {'type': 'string'}}}
+    records = [
+        {'id': 1, 'name': 'a', 'cost': 1.5, 'active': True, 'created': '2017-01-01', 'tags': ['x']},
+        {'id': '1,000', 'name': None, 'cost': '2', 'active': 'false', 'created': '2017-01-01'},
+        {'name': 5, 'cost': None, 'active': None, 'created': None, 'extra': 1, 'secret': 's'},
+        {'id': 'x', 'created': 'not a date', 'tags': 'not a list'},
+        {'id': 4, 'created': '2017-01-01T00:00:00.000000Z'},
+    ]
+    metadata = {('properties', 'secret'): {'selected': False}}
+
+    def test_matches_transform_many(self):
+        expected_trans = Transformer()
+        expected = expected_trans.transform_many(copy.deepcopy(self.records), self.schema,
+                                                 metadata=self.metadata)
+        trans = Transformer()
+        results = trans.transform_columnar(copy.deepcopy(self.records), self.schema,
+                                           metadata=self.metadata)
+        self.assertEqual([result.record for result in expected],
+                         [result.record for result in results])
+        self.assertEqual([sorted(e.path for e in result.errors or []) for result in expected],
+                         [sorted(e.path for e in result.errors or []) for result in results])
+        self.assertEqual(expected_trans.removed, trans.removed)
+        self.assertEqual(expected_trans.filtered, trans.filtered)
+        self.assertEqual(len(expected_trans.errors), len(trans.errors))
+
+    def test_falls_back_to_transform_many(self):
+        schema = {'type': 'object', 'patternProperties': {'.+': {'type': 'integer'}}}
+        results = Transformer().transform_columnar([{'a': '1'}], schema)
+        self.assertEqual([TransformResult({'a': 1}, None)], results)
+        results = Transformer(pre_hook=lambda data, typ, schema: data).transform_columnar(
+            [{'id': '1'}], self.schema)
+        self.assertEqual([TransformResult({'id': 1}, None)], results)
+
+    def test_compiled_transformer_falls_back(self):
+        schema = {'type': 'object', 'properties': {'a': {'type': 'integer'}}}
+        results = CompiledTransformer(schema).transform_columnar([{'a': '1'}, None], schema)
+        self.assertEqual(TransformResult({'a': 1}, None), results[0])
+        self.assertIsNone(results[1].record)
+
+    def test_transform_columns(self):
+        trans = Transformer()
+        columns, failures = trans.transform_columns(
+            {'id': [1, '2', 'x'], 'created': ['2017-01-01', '2017-01-01', None], 'extra': [1, 2, 3]},
+            self.schema)
+        self.assertEqual({'id': [1, 2, None],
+                          'created': ['2017-01-01T00:00:00.000000Z'] * 2 + [None]},
+                         columns)
+        self.assertEqual([2], list(failures))
+        self.assertEqual({'extra'}, trans.removed)
+
+
+class TestParallelTransformer(unittest.TestCase):
+    def test_transform_many(self):
+        schema = {'type': 'object',
+                  'properties': {'id': {'type': 'integer'},
+                                 'name': {'type': ['null', 'string']}}}
+        records = [{'id': str(i), 'name': i, 'extra': i} for i in range(25)]
+        records[7]['id'] = 'not an integer'
+        metadata = {('properties', 'name'): {'selected': False}}
+        with ParallelTransformer(schema, max_workers=2, chunk_size=10) as trans:
+            results = trans.transform_many(records, metadata=metadata)
+        expected = [{'id': i} for i in range(25)]
+        expected[7] = None
+        self.assertEqual(expected, [result.record for result in results])
+        self.assertEqual([['id'], []], [e.path for e in results[7].errors])
+        self.assertEqual({'name'}, trans.filtered)
+        self.assertEqual({'extra'}, trans.removed)
+        self.assertEqual(2, len(trans.errors))
+        self.assertIsNone(trans._executor)
+
+    def test_summarizes_worker_datetime_warnings(self):
+        schema = {'type': 'object',
+                  'properties': {'updated_at': {'type': 'string', 'format': 'date-time'}}}
+        records = [{'updated_at': 'not a datetime'} for _ in range(25)]
+        with mock.patch('singer.transform.DATETIME_WARNINGS', LogSampler(LOGGER, first=2)):
+            with self.assertLogs(LOGGER, 'WARNING') as logs:
+                with ParallelTransformer(schema, max_workers=2, chunk_size=10,
+                                         mp_context=multiprocessing.get_context('fork')) as trans:
+                    trans.transform_many(records)
+        summary, = [record.args for record in logs.records
+                    if record.msg.startswith('%s more occurrences')]
+        not_logged, _, path, occurrences = summary
+        self.assertEqual('updated_at', path)
+        self.assertIn(not_logged, (21, 23))
+        self.assertEqual(25, occurrences)
+
+
 class TestTransformsWithMetadata(unittest.TestCase):
 
     def test_drops_no_data_when_not_dict(self):
@@ -295,6 +530,29 @@ class TestTransformsWithMetadata(unittest.TestCase):
         dict_value = {'name': 'chicken'}
         self.assertEqual({}, transform(dict_value, schema, NO_INTEGER_DATETIME_PARSING, metadata=metadata))
 
+    def test_compiled_metadata_filter(self):
+        schema = {'type': 'object',
+                  'properties': {'id': {'type': 'integer'},
+                                 'name': {'type': 'string'},
+                                 'secret': {'type': 'string'},
+                                 'legacy': {'type': 'string'},
+                                 'email': {'type': 'string'}}}
+        metadata = {(): {'selected': True},
+                    ('properties', 'id'): {'inclusion': 'automatic', 'selected': False},
+                    ('properties', 'name'): {'inclusion': 'available', 'selected': True},
+                    ('properties', 'secret'): {'inclusion': 'available', 'selected': False},
+                    ('properties', 'legacy'): {'inclusion': 'unsupported'},
+                    ('properties', 'nested', 'properties', 'x'): {'selected': False}}
+        drop = compile_metadata_filter(metadata)
+        self.assertEqual(frozenset(['secret', 'legacy']), drop)
+
+        data = {'id': 1, 'name': 'a', 'secret': 'b', 'legacy': 'c', 'email': 'd'}
+        expected_trans = Transformer()
+        expected = expected_trans.transform(dict(data), schema, metadata=metadata)
+        trans = Transformer()
+        self.assertEqual(expected, trans.transform(dict(data), schema, metadata=drop))
+        self.assertEqual(expected_trans.filtered, trans.filtered)
+
 class TestResolveSchemaReferences(unittest.TestCase):
     def test_internal_refs_resolve(self):
         schema =  {'type': 'object',
@@ -376,3 +634,29 @@ class TestPatternProperties(unittest.TestCase):
         dict_value = {'name': 'chicken', 'unit_cost': 1.45, 'SKU': '123456'}
         expected = dict(dict_value)
         self.assertEqual(expected, transform(dict_value, schema))
+
+    def test_pattern_properties_resolved_once_per_key(self):
+        schema = {'type': 'object',
+                  'properties': {'id': {'type': 'integer'}},
+                  'patternProperties': {'^custom_': {'type': 'integer'},
+                                        '.*_count$': {'type': 'integer'}}}
+        trans = Transformer()
+        compiled = compile_schema(schema)
+        for _ in range(2):
+            for schema_or_compiled in (schema, compiled):
+                self.assertEqual({'id': 1, 'custom_a': 2, 'custom_count': 3},
+                                 trans.transform({'id': '1', 'custom_a': '2', 'custom_count': '3', 'other': 4},
+                                                 schema_or_compiled))
+        index = trans._pattern_index(schema['patternProperties'])
+        self.assertEqual({'custom_a', 'custom_count', 'other'}, set(index.resolved))
+        self.assertEqual(2, len(index.get('custom_count')['anyOf']))
+        self.assertIsNone(index.get('other'))
+        self.assertEqual({'other'}, trans.removed)
+
+
+    def test_pattern_indexes_bounded(self):
+        trans = Transformer()
+        for i in range(PATTERN_INDEX_CACHE_SIZE + 10):
+            schema = {'type': 'object', 'patternProperties': {'.+': {'type': 'integer'}}}
+            self.assertEqual({'a': i}, trans.transform({'a': str(i)}, schema))
+        self.assertEqual(PATTERN_INDEX_CACHE_SIZE, len(trans._pattern_indexes))